@@ -0,0 +1,223 @@
+# Optional helper: Benchmark all four steps on synthetic data of increasing size, without a cluster
+
+# For every number of neurons in scales, a workspace is filled with a synthetic parameters.pkl, a synthetic partition,
+# synthetic TriDy result files and stand-ins of TriDy's toolbox.py and pipeline.py (see tridy_tools/synthetic.py)
+# Each step is then run on these, as a separate process from the workspace, and its runtime and peak memory are measured
+# Synthetic inputs are created in a process of their own, and the peak memory of a step is that of its own process (its 'total' span),
+# so that neither includes the memory of this script
+# Steps are independent: create-parameters.py, create-runfiles.py and collect-results.py use the synthetic partition, not the one of create-bins.py
+# The report is saved as report-<time>.json in report_dir, and compared against the baseline report if there is one
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import os
+import sys
+import time
+import shutil
+import pickle
+import platform
+import subprocess
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+from tridy_tools.synthetic import synthetic_parameters, synthetic_partition, synthetic_results, synthetic_tridy
+from tridy_tools.spans import read_spans
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+scales = config_dict['values']['scales']                                # List of numbers of neurons to benchmark at
+num_columns = config_dict['values']['num_columns']                      # Number of parameter columns of the synthetic dataframe, taken in order from parameters-shortnames.pickle. Default is 44 (all)
+num_extra_columns = config_dict['values']['num_extra_columns']          # Number of further random columns of the synthetic dataframe. Default is 0
+binsize_target = config_dict['values']['binsize_target']                # Size of bins of create-bins.py and of the synthetic partition. Default is 50
+storage_format = config_dict['values']['storage_format']                # Storage format of create-parameters.py. Default is index
+num_jobs = config_dict['values']['num_jobs']                            # Number of jobs of create-runfiles.py, and of synthetic result files. Default is 100
+result_records = config_dict['values']['result_records']                # Whether or not to also write result records, read by collect-results.py instead of the text files. Default is False
+num_processes = config_dict['values']['num_processes']                  # Number of processes of collect-results.py. Default is 4
+stages = config_dict['values']['stages']                                # List of steps to run. Default is all four
+timeout_seconds = config_dict['values']['timeout_seconds']              # Time after which a step is stopped and counted as failed. Default is 3600
+tolerance = config_dict['values']['tolerance']                          # Ratio of runtime or peak memory to the baseline above which a step is reported as a regression. Default is 1.25
+save_baseline = config_dict['values']['save_baseline']                  # Whether or not to save this report as the new baseline. Default is False
+
+# Paths of files and folders
+workspace_dir = config_dict['paths']['workspace_dir']                   # Where synthetic inputs and outputs of the steps are written. Emptied for every scale. Default is ./benchmarks/workspace/
+report_dir = config_dict['paths']['report_dir']                         # Where to save the report. Default is ./benchmarks/
+baseline = config_dict['paths']['baseline']                             # Report to compare against. Default is ./benchmarks/baseline.json
+
+repo_dir = Path(__file__).resolve().parent
+workspace = Path(workspace_dir).resolve()
+assert workspace != repo_dir and not Path(workspace, 'create-bins.py').is_file(), 'Workspace '+str(workspace)+' is the TriDy-tools directory, which would be emptied. Change workspace_dir in config file.'
+assert set(stages) <= set(['create-bins', 'create-parameters', 'create-runfiles', 'collect-results']), 'Stages must be among \'create-bins\', \'create-parameters\', \'create-runfiles\', \'collect-results\'.'
+
+with open(repo_dir/'data'/'parameters-shortnames.pickle', 'rb') as f:
+    df_shortdict = pickle.load(f)
+
+created_file_counter = 0
+
+##
+## Load functions
+##
+
+print('Loading helper functions', flush=True)
+
+# Writes the synthetic inputs and the configuration files of all steps for nnum neurons into the workspace
+def prepare_workspace(nnum):
+    if workspace.is_dir():
+        shutil.rmtree(workspace)
+    for folder in ['data', 'bins', 'parameters', 'configs', 'sbatches', 'runfiles', 'results', 'dataframes', 'out-err']:
+        Path(workspace, folder).mkdir(parents=True)
+    shutil.copy(repo_dir/'data'/'parameters-shortnames.pickle', workspace/'data')
+    synthetic_parameters(nnum, list(df_shortdict)[:num_columns], num_extra_columns).to_pickle(workspace/'data'/'parameters.pkl')
+    partition = synthetic_partition(nnum, binsize_target)
+    np.save(workspace/'bins'/'partition_synth.npy', partition)
+    synthetic_results(workspace/'results'/('synth-'+df_shortdict['asg_low']), 'synth', 'asg', len(partition), min(num_jobs, len(partition)), records=result_records)
+    synthetic_tridy(workspace/'TriDy')
+
+    configs = {
+        'create-bins': {
+            'values': {'selection_parameters':['tribe_size', 'rc_per_nodes'], 'add_noise':[True, False], 'binsize_target':binsize_target,
+                'overwrite_existing':True, 'save_centroids':False, 'partitioner':'kdtree'},
+            'paths': {'dataframe':'./data/parameters.pkl', 'noise_files':[], 'bin_dir':'./bins/'}
+            },
+        'create-parameters': {
+            'values': {'selection_parameter_names':['synth'], 'storage_format':storage_format},
+            'paths': {'bin_dir':'./bins/', 'parameter_dir':'./parameters/'}
+            },
+        'create-runfiles': {
+            'values': {'selection_parameters':['synth'], 'feature_parameters':['asg_low'], 'num_jobs':[num_jobs], 'randomise_vectors':True,
+                'check_featurevectors':False, 'check_dataframes':False, 'only_featurise':False, 'packing':'lpt'},
+            'paths': {'json_template':str(repo_dir/'templates'/'template.json'), 'sbatch_template':str(repo_dir/'templates'/'template.sbatch'),
+                'fused_template':str(repo_dir/'templates'/'fused.py'), 'tridy_dir':'./TriDy/', 'bin_dir':'./bins/', 'parameter_dir':'./parameters/',
+                'config_dir':'./configs/', 'sbatch_dir':'./sbatches/', 'runfile_dir':'./runfiles/', 'results_dir':'./results/',
+                'dataframe_dir':'./dataframes/', 'dataframe':'./data/parameters.pkl'}
+            },
+        'collect-results': {
+            'overwrite_existing':True, 'collect_incomplete':False, 'bin_dir':'./bins/', 'results_dir':'./results/', 'dataframe_dir':'./dataframes/',
+            'incremental':False, 'num_processes':num_processes
+            }
+        }
+    for stage,config in configs.items():
+        with open(workspace/(stage+'.config'), 'w') as f:
+            json.dump(config, f, indent=2)
+
+# Runs prepare_workspace in a forked process, so that the synthetic inputs are freed before steps are started
+# Returns the time taken
+def prepare_in_process(nnum):
+    start = time.time()
+    process = mp.get_context('fork').Process(target=prepare_workspace, args=(nnum,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0, 'Creating synthetic inputs for '+str(nnum)+' neurons failed with exit code '+str(process.exitcode)
+    return time.time()-start
+
+# Runs one step in the workspace, returns its runtime, peak memory in MB, exit code, whether it was stopped, and the wall time of its sections
+# Peak memory is that of the 'total' span of the step, or the one given by wait4 if the step wrote none
+# Output and errors are written to out-err/<stage>.log in the workspace, spans to out-err/spans.jsonl
+def run_stage(stage):
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([str(repo_dir)]+[p for p in [os.environ.get('PYTHONPATH')] if p]))
+    timed_out = False
+    start = time.time()
+    with open(workspace/'out-err'/(stage+'.log'), 'w') as log:
+        process = subprocess.Popen([sys.executable, str(repo_dir/(stage+'.py')), stage+'.config'], cwd=workspace, env=environment, stdout=log, stderr=subprocess.STDOUT)
+        # Wait with wait4, which gives the resource usage of this step and its children
+        while True:
+            pid,status,usage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            if not timed_out and time.time()-start > timeout_seconds:
+                process.kill()
+                timed_out = True
+            time.sleep(0.02)
+    seconds = time.time()-start
+    span_file = workspace/'out-err'/'spans.jsonl'
+    spans = [s for s in read_spans([span_file] if span_file.is_file() else []) if s['stage'] == stage and s['parent'] is None]
+    sections = {s['span']:s['wall'] for s in spans}
+    totals = [s['max_rss_mb'] for s in spans if s['span'] == 'total']
+    return {'seconds':seconds, 'max_rss_mb':totals[-1] if totals != [] else usage.ru_maxrss/1024, 'returncode':os.waitstatus_to_exitcode(status), 'timed_out':timed_out, 'sections':sections}
+
+# Returns the last lines of the log of a step
+def log_tail(stage, num_lines=5):
+    with open(workspace/'out-err'/(stage+'.log'), 'r', errors='replace') as f:
+        return ''.join(f.readlines()[-num_lines:])
+
+##
+## Run benchmarks
+##
+
+report = {
+    'time':time.strftime('%Y-%m-%d %H:%M:%S'),
+    'machine':{'platform':platform.platform(), 'python':platform.python_version(), 'numpy':np.__version__, 'cpu_count':os.cpu_count()},
+    'config':config_dict['values'],
+    'results':{}
+    }
+for nnum in scales:
+    print('----------\n'+str(nnum)+' neurons', flush=True)
+    print('Creating synthetic inputs', flush=True)
+    report['results'][str(nnum)] = {'prepare':{'seconds':prepare_in_process(nnum)}}
+    for stage in stages:
+        result = run_stage(stage)
+        report['results'][str(nnum)][stage] = result
+        status = 'done' if result['returncode'] == 0 else ('TIMEOUT' if result['timed_out'] else 'FAILED ('+str(result['returncode'])+')')
+        print('{0}: {1} in {2:.2f}s, {3:.0f} MB'.format(stage, status, result['seconds'], result['max_rss_mb']), flush=True)
+        if result['returncode'] != 0:
+            print(log_tail(stage), flush=True)
+
+Path(report_dir).mkdir(parents=True, exist_ok=True)
+report_file = Path(report_dir, 'report-'+time.strftime('%Y%m%d-%H%M%S')+'.json')
+with open(report_file, 'w') as f:
+    json.dump(report, f, indent=1)
+created_file_counter += 1
+print('Saved report to '+str(report_file), flush=True)
+
+##
+## Compare against baseline
+##
+
+regressions = 0
+if Path(baseline).is_file():
+    print('----------\nComparing against '+baseline, flush=True)
+    with open(baseline, 'r') as f:
+        baseline_results = json.load(f)['results']
+    for scale,stage_results in report['results'].items():
+        for stage,result in stage_results.items():
+            previous = baseline_results.get(scale, {}).get(stage)
+            if stage == 'prepare' or previous is None:
+                continue
+            if result['returncode'] != 0 or previous['returncode'] != 0:
+                if result['returncode'] != previous['returncode']:
+                    print('{0} {1}: exit code {2}, was {3}'.format(scale, stage, result['returncode'], previous['returncode']), flush=True)
+                    regressions += result['returncode'] != 0
+                continue
+            # Differences below half a second or 10 MB are not counted, these are mostly noise
+            time_ratio = result['seconds']/max(previous['seconds'], 1e-9)
+            memory_ratio = result['max_rss_mb']/max(previous['max_rss_mb'], 1e-9)
+            slower = time_ratio > tolerance and result['seconds']-previous['seconds'] > 0.5
+            larger = memory_ratio > tolerance and result['max_rss_mb']-previous['max_rss_mb'] > 10
+            regressions += slower or larger
+            print('{0} {1}: time x{2:.2f}, memory x{3:.2f}{4}'.format(scale, stage, time_ratio, memory_ratio, ' REGRESSION' if slower or larger else ''), flush=True)
+    print(str(regressions)+' regressions', flush=True)
+else:
+    print('No baseline found at '+baseline, flush=True)
+
+if save_baseline:
+    shutil.copy(report_file, baseline)
+    created_file_counter += 1
+    print('Saved report as baseline', flush=True)
+
+##
+## Print what was done
+##
+
+print('----------\nCreated '+str(created_file_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
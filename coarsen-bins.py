@@ -0,0 +1,98 @@
+# Optional step after step 1: Create coarser partitions from an existing fine partition
+
+# Sibling bins are merged along shared prefixes of their split order (the less / greater path of each bin)
+# No dataframe is loaded, no noise is added and no kd-tree is built, so the coarse bins are unions of fine bins
+# Number of bins of a coarse partition is at most 2^n, for n given in the configuration file as 2^n
+# Bins whose split order is shorter than n are not split further, so fewer bins are possible
+# The coarse partition of <name> with 2^n bins is named <name>_b<2^n>
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import sys
+from pathlib import Path
+import numpy as np
+from tridy_tools.catalog import record_partition, config_hash
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+selection_parameter_names = config_dict['values']['selection_parameter_names']    # List of names of fine partitions to coarsen. Should be short names, joined by underscore
+num_bins = config_dict['values']['num_bins']                                      # List of numbers of bins of coarse partitions. Each must be a power of two
+overwrite_existing = config_dict['values']['overwrite_existing']                  # Whether or not to overwrite existing coarse partitions. Default is False.
+
+# Paths of files and folders
+bin_dir = config_dict['paths']['bin_dir']                                         # Location of the partition, split and bounds created in step 1, and where coarse partitions are exported. Default is ./bins/
+catalog = config_dict['paths'].get('catalog', './catalog.sqlite')                 # Catalog in which coarse partitions are recorded. Default is ./catalog.sqlite
+
+for n in num_bins:
+    assert n > 0 and n & (n-1) == 0, 'Number of bins '+str(n)+' is not a power of two'
+
+created_file_counter = 0
+
+##
+## Iterate through selection parameters
+##
+
+for sparam in selection_parameter_names:
+    print(sparam, flush=True)
+
+    # Load partition, split order and bounds (if centroids were saved)
+    print('Loading partition and split order', flush=True)
+    partition = np.load(bin_dir+'partition_'+sparam+'.npy', allow_pickle=True)
+    split = np.load(bin_dir+'split_'+sparam+'.npy')
+    assert len(partition) == len(split), 'Partition and split order of '+sparam+' have different lengths'
+    bounds_file = Path(bin_dir+'bounds_'+sparam+'.npy')
+    bounds = np.load(bounds_file) if bounds_file.is_file() else None
+    if bounds is None:
+        print('No bounds file found, centroids will not be saved', flush=True)
+
+    for n in num_bins:
+        depth = n.bit_length()-1
+        coarse_name = sparam+'_b'+str(n)
+        print('Merging '+str(len(partition))+' bins to depth '+str(depth)+' ('+coarse_name+')', flush=True)
+
+        # Bins are in depth-first order, so bins with a common prefix are consecutive
+        prefixes = [order_string[:depth] for order_string in split]
+        starts = [0]+[i for i in range(1,len(prefixes)) if prefixes[i] != prefixes[i-1]]
+        ends = starts[1:]+[len(prefixes)]
+        coarse_split = [prefixes[start] for start in starts]
+        assert len(set(coarse_split)) == len(coarse_split), 'Split order of '+sparam+' is not in depth-first order'
+        print('Merged into '+str(len(coarse_split))+' bins', flush=True)
+
+        # Bins are filled element by element, so that bins of equal size are not stacked into a 2D array
+        coarse_partition = np.empty(len(coarse_split), dtype=object)
+        for i,(start,end) in enumerate(zip(starts,ends)):
+            coarse_partition[i] = np.concatenate([np.asarray(b,dtype=int) for b in partition[start:end]])
+        outputs = [('partition_', coarse_partition), ('split_', np.array(coarse_split))]
+
+        # Bounds of merged bins are the union of bounds (empty bins have NaN bounds, and are ignored), centroids are their centers
+        if bounds is not None:
+            coarse_bounds = np.array([[np.nanmin(bounds[start:end,0],axis=0), np.nanmax(bounds[start:end,1],axis=0)] for start,end in zip(starts,ends)])
+            outputs += [('centroids_', coarse_bounds.mean(axis=1)), ('bounds_', coarse_bounds)]
+
+        # Export
+        for prefix,array in outputs:
+            location = Path(bin_dir+prefix+coarse_name+'.npy')
+            if not overwrite_existing:
+                assert not location.is_file(), 'File '+str(location)+' exists, but config file says to not overwrite. Delete file or change config file.'
+            np.save(location, array)
+            created_file_counter += 1
+        record_partition(catalog, coarse_name, bin_dir+'partition_'+coarse_name+'.npy', coarse_partition, sum(len(b) for b in coarse_partition), config_hash({'partition':sparam, 'num_bins':n}))
+
+##
+## Print what was done
+##
+
+print('----------\nCreated '+str(created_file_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
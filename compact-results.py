@@ -0,0 +1,74 @@
+# Optional step after step 3: Pack the per-bin feature vector files of results folders into one archive per folder
+
+# The <sparam>-<i>_feature_vectors.npy files of a results folder are appended to feature_vectors.bin, with the index feature_vectors.json
+# Can be run again while jobs are still running, only files not yet in the archive are appended
+# Loose files are removed only if remove_loose is True, and only after their archived copy has been checked
+# TriDy itself reads the loose files, so these should only be removed once no more jobs use them (for example after classification)
+# Archived bins count as featurised for create-runfiles.py and the feature store, see tridy_tools/vector_archive.py for reading them
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import os
+import sys
+from pathlib import Path
+import numpy as np
+from tridy_tools.completion import update_completion, feature_suffix
+from tridy_tools.vector_archive import append_vectors, read_archive_index, load_vector
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+names = config_dict['values']['names']                                  # List of results folders to compact, named <sparam>-<fshort>. All folders if empty
+remove_loose = config_dict['values']['remove_loose']                    # Whether or not to remove the loose feature vector files once archived. Default is False
+
+# Paths of files and folders
+results_dir = config_dict['paths']['results_dir']                      # Where the feature vectors are located. Default is ./results/
+
+if names == []:
+    names = sorted(folder.name for folder in os.scandir(results_dir) if folder.is_dir())
+
+archived_counter = 0
+removed_counter = 0
+
+##
+## Compact results folders
+##
+
+for name in names:
+    folder = Path(results_dir, name)
+    with os.scandir(folder) as it:
+        loose = sorted(file.name[:-len(feature_suffix)] for file in it if file.name.endswith(feature_suffix))
+    added = append_vectors(folder, loose)
+    archived_counter += len(added)
+    print(name+': '+str(len(loose))+' loose files, '+str(len(added))+' added to the archive', flush=True)
+
+    # Remove loose files whose archived copy is identical
+    if remove_loose:
+        index = read_archive_index(folder)
+        for vector_name in loose:
+            if vector_name in index:
+                loose_file = Path(folder, vector_name+feature_suffix)
+                if np.array_equal(load_vector(folder, vector_name, index), np.load(loose_file, allow_pickle=True)):
+                    loose_file.unlink()
+                    removed_counter += 1
+
+update_completion(results_dir, names)
+
+##
+## Print what was done
+##
+
+print('----------\nArchived '+str(archived_counter)+' feature vector files', flush=True)
+print('Removed '+str(removed_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
@@ -0,0 +1,48 @@
+# Optional step before step 1: Convert the parameters dataframe to a columnar store
+
+# The store is a directory with one .npy file per column and an index file columns.json
+# Giving the store directory as dataframe in create-bins.config loads only the columns that are used, through a memory map
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import sys
+from pathlib import Path
+from tridy_tools.parameter_store import convert_dataframe, index_name
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+overwrite_existing = config_dict['values']['overwrite_existing']        # Whether or not to overwrite an existing store. Default is False.
+
+# Paths of files and folders
+dataframe = config_dict['paths']['dataframe']                           # Filename of the pickled dataframe to convert. Default is ./data/parameters.pkl
+store_dir = config_dict['paths']['store_dir']                           # Directory to which the columns will be exported. Default is ./data/parameters/
+
+##
+## Convert dataframe
+##
+
+if not overwrite_existing:
+    location = Path(store_dir, index_name)
+    assert not location.is_file(), 'Store exists, but config file says to not overwrite. Delete store or change config file.'
+
+print('Converting '+dataframe+' to columnar store', flush=True)
+created_file_counter = convert_dataframe(dataframe, store_dir)
+
+##
+## Print what was done
+##
+
+print('----------\nCreated '+str(created_file_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
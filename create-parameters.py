@@ -1,7 +1,10 @@
 # Step 2 of 4: Create 'paramaters' for use in the TriDy pipeline
 
-# These are binary vectors of length 31346, with 1 in the positions of neurons to select, and 0 otherwise
+# These are binary vectors with one entry per neuron, 1 in the positions of neurons to select, and 0 otherwise
+# The number of neurons is the one recorded in the catalog by create-bins.py, or the number of neurons in the partition
 # An input partition is necessary to create these parameters
+# The vectors are either saved one file per bin (dense), or all bins of a partition in one file (packed or index)
+# The work is done by create_parameters() in tridy_tools/create_parameters.py, where the configuration values are described
 
 ##
 ## Load packages
@@ -10,9 +13,7 @@
 print('Loading packages', flush=True)
 import json
 import sys
-import numpy as np
-
-nnum = 31346
+from tridy_tools.create_parameters import create_parameters
 
 ##
 ## Read config file
@@ -23,34 +24,11 @@ config_address = sys.argv[1]
 with open(config_address, 'r') as f:
     config_dict = json.load(f)
 
-# Values
-selection_parameter_names = config_dict['values']['selection_parameter_names']    # List of names of new 'parameters'. Should be short names, joined by underscore
-
-# Paths of files and folders
-bin_dir = config_dict['paths']['bin_dir']                                         # Location of the partition (made of bins) created in step 1. Default is ./bins/
-parameter_dir = config_dict['paths']['parameter_dir']                             # Where to export the binary parameters. Default is ./parameters/
-
-created_file_counter = 0
-
 ##
 ## Iterate through selection parameters
 ##
 
-for sparam in selection_parameter_names:
-    print(sparam, flush=True)
-
-    # Load partition file
-    print('Loading partition', flush=True)
-    partition = np.load(bin_dir+'partition_'+sparam+'.npy', allow_pickle=True)
-
-    # Create vectors
-    print('Creating binary parameter vectors', flush=True)
-    for i,b in enumerate(partition):
-        current_parameter = np.zeros(nnum,dtype=int)
-        for neuron in b:
-            current_parameter[neuron] = 1
-        np.save(parameter_dir + sparam + '-' + str(i) + '.npy',current_parameter)
-        created_file_counter += 1
+matrices,created_file_counter = create_parameters(config_dict)
 
 ##
 ## Print what was done
@@ -0,0 +1,155 @@
+# Optional alternative to step 3's .sh files: Run the jobs created by create-runfiles.py on this machine
+
+# Jobs are the .json files (or the tasks of a job array manifest.json) in configs/<sparam>-<fshort>/
+# They are run with the modified pipeline-<sparam>.py (or fused-<sparam>.py) in a bounded pool of processes, from the TriDy directory
+# Output and errors are written to out-err/, named as by the .sbatch files
+# Runtime and peak memory of every job are saved as local-<time>.json in out-err/, and runtimes per bin are added to results/<sparam>-<fshort>/runtimes.json
+# Runtime of a bin is the wall time of its featurise and classify spans (the 'SPAN' lines of the .err file of its job), bins without spans are not added
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import os
+import sys
+import time
+import resource
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tridy_tools.spans import read_spans
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+names = config_dict['values']['names']                                  # List of job collections to run, named <sparam>-<fshort> as the folders in config_dir
+num_processes = config_dict['values']['num_processes']                  # Number of jobs running at the same time
+memory_limit_gb = config_dict['values']['memory_limit_gb']              # Limit of (virtual) memory of each job, in GB. No limit if 0
+record_runtimes = config_dict['values']['record_runtimes']              # Whether or not to add runtimes per bin to runtimes.json in the results folders, used by packing in create-runfiles.py. Default is True
+
+# Paths of files and folders
+tridy_dir = config_dict['paths']['tridy_dir']                           # Location of TriDy package, jobs are run from here. Default is ./../TriDy/
+config_dir = config_dict['paths']['config_dir']                         # Location of the configuration .json files created in step 3. Default is ./configs/
+runfile_dir = config_dict['paths']['runfile_dir']                       # Location of the modified pipeline files created in step 3. Default is ./runfiles/
+results_dir = config_dict['paths']['results_dir']                       # Where the classification results are located. Default is ./results/
+outerr_dir = config_dict['paths']['outerr_dir']                         # Where output and errors of jobs are written. Default is ./out-err/
+
+created_file_counter = 0
+
+##
+## Load functions
+##
+
+print('Loading helper functions', flush=True)
+
+# Returns the jobs of a collection, as tuples (name, job number, configuration file, environment, bins)
+def collect_jobs(name):
+    jobs = []
+    current_dir = Path(config_dir, name)
+    manifest_file = current_dir/'manifest.json'
+    if manifest_file.is_file():
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        for task,bins in manifest['tasks'].items():
+            jobs.append((name, int(task), manifest_file, {'SLURM_ARRAY_TASK_ID':task}, bins))
+    else:
+        for config_file in current_dir.glob('*.json'):
+            with open(config_file, 'r') as f:
+                bins = json.load(f)['values']['selection_parameters']
+            jobs.append((name, int(config_file.stem), config_file, {}, bins))
+    return sorted(jobs, key=lambda job: job[1])
+
+# Sets the memory limit of a job, called in the job process before the pipeline starts
+def limit_memory():
+    if memory_limit_gb > 0:
+        limit = int(memory_limit_gb*1024**3)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+# Runs one job, and returns (name, job number, exit code, seconds, peak memory in MB, bins)
+def run_job(job):
+    name,job_num,config_file,environment,bins = job
+    sparam = name.split('-')[0]
+    script = 'fused-' if '+' in name else 'pipeline-'
+    pipeline = Path(runfile_dir, script+sparam+'.py').resolve()
+    start = time.time()
+    with open(Path(outerr_dir, name+'-'+str(job_num)+'.out'), 'w') as out, open(Path(outerr_dir, name+'-'+str(job_num)+'.err'), 'w') as err:
+        process = subprocess.Popen([sys.executable, str(pipeline), str(config_file.resolve())], cwd=tridy_dir, env=dict(os.environ, **environment), stdout=out, stderr=err, preexec_fn=limit_memory)
+        # Wait with wait4, which gives the resource usage of this job only
+        _,status,usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    return (name, job_num, process.returncode, time.time()-start, usage.ru_maxrss/1024, bins)
+
+##
+## Run jobs
+##
+
+jobs = []
+for name in names:
+    current_jobs = collect_jobs(name)
+    print(name+': '+str(len(current_jobs))+' jobs', flush=True)
+    jobs += current_jobs
+
+print('----------\nRunning '+str(len(jobs))+' jobs with '+str(num_processes)+' processes', flush=True)
+start = time.time()
+records = []
+failed = 0
+# Threads only wait for the job processes, so a thread pool bounds the number of running jobs
+with ThreadPoolExecutor(max_workers=num_processes) as pool:
+    futures = [pool.submit(run_job, job) for job in jobs]
+    for future in as_completed(futures):
+        name,job_num,returncode,seconds,memory,bins = future.result()
+        records.append({'name':name, 'job':job_num, 'returncode':returncode, 'seconds':seconds, 'max_rss_mb':memory, 'bins':bins})
+        failed += returncode != 0
+        elapsed = time.time()-start
+        print('[{0}/{1}] {2}-{3} {4} in {5:.1f}s, {6:.0f} MB | {7} failed | {8:.1f} jobs/hour'.format(
+            len(records), len(jobs), name, job_num, 'done' if returncode == 0 else 'FAILED ('+str(returncode)+')',
+            seconds, memory, failed, 3600*len(records)/elapsed
+        ), flush=True)
+
+##
+## Save runtimes
+##
+
+summary_file = Path(outerr_dir, 'local-'+time.strftime('%Y%m%d-%H%M%S')+'.json')
+with open(summary_file, 'w') as f:
+    json.dump({'num_processes':num_processes, 'memory_limit_gb':memory_limit_gb, 'seconds':time.time()-start, 'jobs':records}, f, indent=1)
+created_file_counter += 1
+
+# Runtime of a bin is the sum of its featurise and classify spans, in the results folder of each feature
+# Spans without a results folder (from pipeline files made before spans recorded it) are only used if the job has one feature
+if record_runtimes:
+    runtimes = {}
+    for record in records:
+        err_file = Path(outerr_dir, record['name']+'-'+str(record['job'])+'.err')
+        if record['returncode'] != 0 or not err_file.is_file():
+            continue
+        for current_span in read_spans([err_file]):
+            folder = current_span.get('folder') or (record['name'] if '+' not in record['name'] else None)
+            if current_span.get('span') in ['featurise', 'classify'] and current_span.get('bin') in record['bins'] and folder is not None:
+                member_runtimes = runtimes.setdefault(folder, {})
+                member_runtimes[current_span['bin']] = member_runtimes.get(current_span['bin'], 0)+current_span['wall']
+    for member,member_runtimes in runtimes.items():
+        runtime_file = Path(results_dir, member, 'runtimes.json')
+        if runtime_file.is_file():
+            with open(runtime_file, 'r') as f:
+                member_runtimes = dict(json.load(f), **member_runtimes)
+        with open(runtime_file, 'w') as f:
+            json.dump(member_runtimes, f)
+        created_file_counter += 1
+
+##
+## Print what was done
+##
+
+print('----------\nRan '+str(len(records))+' jobs, of which '+str(failed)+' failed', flush=True)
+print('Created '+str(created_file_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
@@ -0,0 +1,113 @@
+# Optional driver of all four steps: Rebuild only the artifacts that are out of date, as make does
+
+# The artifacts of the four steps (noise, partitions with split order, centroids and statistics, binary parameters, job files, results and dataframes)
+# are given by the configuration files of the steps, and form a dependency graph (see tridy_tools/artifacts.py)
+# Each artifact is fingerprinted by the configuration values it is made from and by the fingerprints of its inputs, and recorded in the catalog when built
+# Only stale artifacts are built: for example, a changed binsize_target rebuilds the partitions and everything made from them (but keeps their noise),
+# and a new feature parameter only adds its job files. The overwrite flags of the configuration files are not used
+# Branches of different partitions (bins, parameters, job files) are built in parallel, then dataframes are collected for results that changed
+# Results are written by the jobs, which are not run here. Dataframes of results that are missing or incomplete stay stale until these are written
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import json
+import sys
+import pickle
+import multiprocessing as mp
+from tridy_tools.artifacts import build_graph, stale_artifacts, build_branch, build_dataframes
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+num_processes = config_dict['values'].get('num_processes', mp.cpu_count())          # Number of partitions (branches) built at the same time. Default is the number of CPUs
+dry_run = config_dict['values'].get('dry_run', False)                               # If true, only lists stale artifacts and why they are stale, without building them. Default is False
+
+# Paths of files and folders
+bins_config = config_dict['paths'].get('bins_config', './create-bins.config')                  # Configuration file of step 1. Default is ./create-bins.config
+parameters_config = config_dict['paths'].get('parameters_config', './create-parameters.config')    # Configuration file of step 2. Default is ./create-parameters.config
+runfiles_config = config_dict['paths'].get('runfiles_config', './create-runfiles.config')      # Configuration file of step 3. Default is ./create-runfiles.config
+results_config = config_dict['paths'].get('results_config', './collect-results.config')        # Configuration file of step 4. Default is ./collect-results.config
+catalog = config_dict['paths'].get('catalog', './catalog.sqlite')                             # Catalog in which built artifacts are recorded with their fingerprints. Default is ./catalog.sqlite
+
+step_configs = []
+for step_config in [bins_config, parameters_config, runfiles_config, results_config]:
+    with open(step_config, 'r') as f:
+        step_configs.append(json.load(f))
+
+with open('data/parameters-shortnames.pickle', 'rb') as f:
+    df_shortdict = pickle.load(f)
+
+##
+## Find stale artifacts
+##
+
+print('Finding stale artifacts', flush=True)
+graph = build_graph(*step_configs, df_shortdict)
+stale = stale_artifacts(graph, catalog)
+for node in graph:
+    if node['kind'] not in ['input', 'results']:
+        print(node['name']+': '+('up to date' if stale[node['name']] is None else stale[node['name']]), flush=True)
+print(str(sum(reason is not None for reason in stale.values()))+' of '+str(sum(node['kind'] not in ['input', 'results'] for node in graph))+' artifacts are stale', flush=True)
+
+# Stale artifacts of every branch in order, leaving out those with missing inputs
+buildable = [node for node in graph if stale[node['name']] is not None and not stale[node['name']].startswith('missing ')]
+branches = {}
+for node in buildable:
+    if node['kind'] in ['noise', 'bins', 'parameters', 'runfiles']:
+        branches.setdefault(node['branch'], []).append(node)
+dataframe_nodes = [node for node in buildable if node['kind'] == 'dataframe']
+
+built = []
+failed = []
+
+##
+## Build stale branches
+##
+
+if not dry_run and branches != {}:
+    print('----------\nBuilding '+str(len(branches))+' partitions with '+str(min(num_processes, len(branches)))+' processes', flush=True)
+    tasks = [(nodes, catalog) for nodes in branches.values()]
+    if num_processes > 1 and len(tasks) > 1:
+        with mp.get_context('fork').Pool(min(num_processes, len(tasks))) as pool:
+            branch_results = list(pool.imap(build_branch, tasks))
+    else:
+        branch_results = [build_branch(task) for task in tasks]
+    for branch,(branch_built,error) in zip(list(branches), branch_results):
+        for name in branch_built:
+            print('Built '+name, flush=True)
+        built += branch_built
+        if error is not None:
+            print('Failed '+error, flush=True)
+            failed.append(branch)
+
+##
+## Collect results
+##
+
+# Dataframes of partitions that failed are not collected, since their partition may not be the one of their fingerprint
+dataframe_nodes = [node for node in dataframe_nodes if node['branch'] not in failed]
+if not dry_run and dataframe_nodes != []:
+    print('----------\nCollecting '+str(len(dataframe_nodes))+' dataframes', flush=True)
+    dataframes_built = build_dataframes(dataframe_nodes, catalog)
+    for node in dataframe_nodes:
+        print(('Built ' if node['name'] in dataframes_built else 'Not exported (incomplete results) ')+node['name'], flush=True)
+    built += dataframes_built
+
+##
+## Print what was done
+##
+
+print('----------\nBuilt '+str(len(built))+' artifacts', flush=True)
+print(str(len(failed))+' partitions failed', flush=True)
+print(str(sum(node['kind'] == 'dataframe' and stale[node['name']] is not None and stale[node['name']].startswith('missing ') for node in graph))+' dataframes are waiting for results', flush=True)
+print('All done, exiting', flush=True)
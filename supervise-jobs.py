@@ -0,0 +1,306 @@
+# Optional alternative to step 3's .sh files: Submit the jobs created by create-runfiles.py and supervise them until all bins are done
+
+# Jobs are the .json and .sbatch files in configs/<sparam>-<fshort>/ and sbatches/<sparam>-<fshort>/ (job arrays are not supported)
+# Jobs are submitted at a limited rate, with a limited number in the queue at the same time
+# Job states are polled with a configurable command (sacct by default, or tridy_tools.stub_scheduler for testing)
+# When a job fails, times out or runs out of memory (also detected from its .err file), its bins without feature vectors or
+# without classification results (unless only_featurise) are split into smaller jobs, which are created next to the existing ones and submitted again
+# The state of the supervisor is saved in out-err/supervisor-state.json, and is resumed from if the supervisor is restarted before all jobs finished
+
+##
+## Load packages
+##
+
+print('Loading packages', flush=True)
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from tridy_tools.completion import update_completion, featurised_bins, classified_bins
+from tridy_tools.resources import format_mem, format_time
+
+##
+## Read config file
+##
+
+print('Reading configuration file', flush=True)
+config_address = sys.argv[1]
+with open(config_address, 'r') as f:
+    config_dict = json.load(f)
+
+# Values and boolean flags
+names = config_dict['values']['names']                                          # List of job collections to run, named <sparam>-<fshort> as the folders in config_dir
+submit_command = config_dict['values']['submit_command']                        # Command to submit an .sbatch file (appended), printing the job ID first. Default is ["sbatch", "--parsable"]
+status_command = config_dict['values']['status_command']                        # Command to get job states of job IDs (appended), printing lines '<id>|<state>'. Default is ["sacct", "-n", "-P", "-o", "JobID,State", "-j"]
+status_separator = config_dict['values'].get('status_separator', ',')          # Separator of job IDs given to status_command. Default is ','
+max_queued = config_dict['values']['max_queued']                                # Largest number of jobs submitted and not yet finished
+max_submissions_per_minute = config_dict['values']['max_submissions_per_minute']    # Largest number of submissions per minute
+poll_interval = config_dict['values']['poll_interval']                          # Seconds between polls of job states
+missing_polls = config_dict['values'].get('missing_polls', 3)                  # Number of polls in a row in which a job is not listed, after which it is taken as finished
+resplit_factor = config_dict['values']['resplit_factor']                        # Number of jobs into which the unfinished bins of a failed job are split
+max_attempts = config_dict['values']['max_attempts']                            # Largest number of attempts for a bin, after which it is given up. Failed submissions count as attempts
+only_featurise = config_dict['values'].get('only_featurise', False)           # Whether the jobs were created with only_featurise, so that bins are finished once they have feature vectors. Default is False
+resource_factor = config_dict['values'].get('resource_factor', 2)              # Factor by which the memory (after OUT_OF_MEMORY) or time (after TIMEOUT) requested by resplit jobs is raised. Default is 2
+
+# Paths of files and folders
+config_dir = config_dict['paths']['config_dir']                                 # Location of the configuration .json files created in step 3. Default is ./configs/
+sbatch_dir = config_dict['paths']['sbatch_dir']                                 # Location of the .sbatch files created in step 3. Default is ./sbatches/
+results_dir = config_dict['paths']['results_dir']                               # Where the feature vectors are located. Default is ./results/
+outerr_dir = config_dict['paths']['outerr_dir']                                 # Where the supervisor state is saved. Default is ./out-err/
+
+terminal_states = ['COMPLETED', 'FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'CANCELLED', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE']
+state_file = Path(outerr_dir, 'supervisor-state.json')
+created_file_counter = 0
+
+##
+## Load functions
+##
+
+print('Loading helper functions', flush=True)
+
+# Returns the jobs of a collection, as dictionaries with name, job number, files, bins and attempt number
+def collect_jobs(name):
+    jobs = []
+    for config_file in Path(config_dir, name).glob('*.json'):
+        if config_file.stem.isdigit():
+            with open(config_file, 'r') as f:
+                bins = [int(b.split('-')[-1]) for b in json.load(f)['values']['selection_parameters']]
+            jobs.append({'name':name, 'job':int(config_file.stem), 'bins':bins, 'attempt':1, 'id':None, 'missing':0})
+    return sorted(jobs, key=lambda job: job['job'])
+
+def json_file(job):
+    return Path(config_dir, job['name'], str(job['job'])+'.json')
+
+def sbatch_file(job):
+    return Path(sbatch_dir, job['name'], str(job['job'])+'.sbatch')
+
+# Returns the path of the .err file of a job, from its .sbatch file
+def err_file(job):
+    with open(sbatch_file(job), 'r') as f:
+        for line in f:
+            parts = line.split()
+            if line.startswith('#SBATCH') and len(parts) > 2 and parts[1] in ['-e', '--error']:
+                return Path(parts[2])
+    return None
+
+# Returns 'TIMEOUT' or 'OUT_OF_MEMORY' if the .err file of a job shows that it was killed, otherwise None
+def log_failure(job):
+    location = err_file(job)
+    if location is None or not location.is_file():
+        return None
+    with open(location, 'rb') as f:
+        f.seek(0, 2)
+        f.seek(max(0, f.tell()-65536))
+        tail = f.read().decode('utf-8', errors='replace').lower()
+    if 'due to time limit' in tail or ('time limit' in tail and 'cancelled' in tail):
+        return 'TIMEOUT'
+    if 'oom-kill' in tail or 'out of memory' in tail or 'out-of-memory' in tail or 'memoryerror' in tail:
+        return 'OUT_OF_MEMORY'
+    return None
+
+# Returns the bins of a job that do not yet have feature vectors, and classification results unless only_featurise, for every feature of the job
+def unfinished_bins(job):
+    sparam,fshort = job['name'].split('-', 1)
+    members = [sparam+'-'+member for member in fshort.split('+')]
+    completion = update_completion(results_dir, members, classified=not only_featurise)
+    done = set.intersection(*[featurised_bins(completion, member, sparam) for member in members])
+    if not only_featurise:
+        done = done.intersection(*[classified_bins(completion, member, sparam) for member in members])
+    return [b for b in job['bins'] if b not in done]
+
+# Returns the seconds of a Slurm time request: minutes, minutes:seconds, hours:minutes:seconds, or days-hours[:minutes[:seconds]]
+def slurm_seconds(value):
+    days,_,rest = value.rpartition('-')
+    parts = [float(part) for part in rest.split(':')]
+    if days != '':
+        parts = parts+[0]*(3-len(parts))
+        return int(days)*86400+parts[0]*3600+parts[1]*60+parts[2]
+    if len(parts) == 1:
+        return parts[0]*60
+    if len(parts) == 2:
+        return parts[0]*60+parts[1]
+    return parts[0]*3600+parts[1]*60+parts[2]
+
+# Returns the .sbatch file content with the memory request (after OUT_OF_MEMORY) or time request (after TIMEOUT) multiplied by resource_factor
+def raise_request(job_sbatch, state):
+    memory_units = {'K':1/1024**2, 'M':1/1024, 'G':1, 'T':1024, '':1/1024}
+    if state == 'OUT_OF_MEMORY':
+        return re.sub(r'^(#SBATCH\s+--mem[=\s])\s*(\d+(?:\.\d+)?)([KMGT]?)B?\b',
+            lambda m: m.group(1)+format_mem(resource_factor*float(m.group(2))*memory_units[m.group(3)]), job_sbatch, flags=re.MULTILINE)
+    if state == 'TIMEOUT':
+        return re.sub(r'^(#SBATCH\s+(?:--time[=\s]|-t\s))\s*(\S+)',
+            lambda m: m.group(1)+format_time(resource_factor*slurm_seconds(m.group(2))), job_sbatch, flags=re.MULTILINE)
+    return job_sbatch
+
+# Creates new jobs for the given bins of a failed job, split into resplit_factor parts, from the files of the failed job
+# After OUT_OF_MEMORY or TIMEOUT (state), the new jobs request more memory or time
+# Returns the list of new jobs
+def resplit(job, bins, state):
+    global created_file_counter
+    with open(json_file(job), 'r') as f:
+        job_config = json.load(f)
+    with open(sbatch_file(job), 'r') as f:
+        job_sbatch = raise_request(f.read(), state)
+    sparam = job['name'].split('-')[0]
+    taken = [int(p.stem) for p in Path(config_dir, job['name']).glob('*.json') if p.stem.isdigit()]
+    next_num = max(taken)+1
+    parts = [bins[k::resplit_factor] for k in range(resplit_factor) if bins[k::resplit_factor] != []]
+    new_jobs = []
+    for part in parts:
+        new_job = {'name':job['name'], 'job':next_num, 'bins':part, 'attempt':job['attempt']+1, 'id':None, 'missing':0}
+        job_config['values']['selection_parameters'] = [sparam+'-'+str(b) for b in part]
+        job_config['values']['job_order'] = next_num
+        with open(json_file(new_job), 'w') as f:
+            json.dump(job_config, f, indent=2)
+        old_name = job['name']+'-'+str(job['job'])
+        new_sbatch = job_sbatch.replace(old_name, job['name']+'-'+str(next_num)).replace('/'+str(job['job'])+'.json', '/'+str(next_num)+'.json')
+        with open(sbatch_file(new_job), 'w') as f:
+            f.write(new_sbatch)
+        created_file_counter += 2
+        new_jobs.append(new_job)
+        next_num += 1
+    return new_jobs
+
+# Runs a command, returns its exit code and output
+async def run_command(args):
+    process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    out,err = await process.communicate()
+    if process.returncode != 0:
+        print('Command '+' '.join(args[:3])+' ... failed: '+err.decode('utf-8', errors='replace').strip(), flush=True)
+    return process.returncode, out.decode('utf-8', errors='replace')
+
+##
+## Supervisor
+##
+
+class Supervisor:
+    def __init__(self, jobs):
+        self.pending = deque(jobs)
+        self.active = {}
+        self.finished = []
+        self.given_up = []
+        self.submitting = []
+        self.submitter_done = False
+
+    # Saves the state, so that a restarted supervisor continues from here
+    def save(self):
+        temporary = state_file.with_suffix('.tmp')
+        with open(temporary, 'w') as f:
+            json.dump({'pending':self.submitting+list(self.pending), 'active':list(self.active.values()), 'finished':self.finished, 'given_up':self.given_up}, f)
+        temporary.replace(state_file)
+
+    # Submits pending jobs, at most max_submissions_per_minute and at most max_queued at the same time
+    # A job being submitted is kept in submitting, so that it is neither pending nor active only between two lines without await
+    # A failed submission counts as an attempt, a job is given up after max_attempts
+    async def submitter(self):
+        try:
+            while self.pending or self.active:
+                if self.pending and len(self.active) < max_queued:
+                    job = self.pending.popleft()
+                    self.submitting.append(job)
+                    returncode,out = await run_command(submit_command+[str(sbatch_file(job))])
+                    self.submitting.remove(job)
+                    if returncode == 0 and out.strip() != '':
+                        job['id'] = out.split()[0].split(';')[0]
+                        job['missing'] = 0
+                        self.active[job['id']] = job
+                        print('Submitted '+job['name']+'-'+str(job['job'])+' ('+str(len(job['bins']))+' bins, attempt '+str(job['attempt'])+') as '+job['id'], flush=True)
+                    elif job['attempt'] >= max_attempts:
+                        job['state'] = 'SUBMIT_FAILED'
+                        self.given_up.append(job)
+                        print('Giving up '+job['name']+'-'+str(job['job'])+' (submission failed, attempt '+str(job['attempt'])+')', flush=True)
+                    else:
+                        job['attempt'] += 1
+                        self.pending.append(job)
+                    await asyncio.sleep(60/max_submissions_per_minute)
+                else:
+                    await asyncio.sleep(1)
+        finally:
+            self.submitter_done = True
+
+    # Polls job states, and handles finished jobs
+    # Runs until the submitter is done, since jobs that are being submitted are not yet active
+    async def poller(self):
+        while not self.submitter_done or self.active:
+            await asyncio.sleep(poll_interval)
+            if not self.active:
+                continue
+            ids = list(self.active)
+            returncode,out = await run_command(status_command+[status_separator.join(ids)])
+            if returncode != 0:
+                continue
+            states = {}
+            for line in out.splitlines():
+                parts = line.strip().split('|')
+                if len(parts) >= 2 and parts[0] in self.active:
+                    states[parts[0]] = parts[1].split()[0] if parts[1].split() != [] else ''
+            for job_id in ids:
+                job = self.active[job_id]
+                state = states.get(job_id)
+                if state is None:
+                    job['missing'] += 1
+                    if job['missing'] < missing_polls:
+                        continue
+                    state = 'COMPLETED'
+                if state in terminal_states:
+                    del self.active[job_id]
+                    self.handle(job, state)
+            self.save()
+            print('{0} pending, {1} active, {2} finished, {3} given up'.format(len(self.pending), len(self.active), len(self.finished), len(self.given_up)), flush=True)
+
+    # Resubmits the unfinished bins of a finished job, split into smaller jobs
+    def handle(self, job, state):
+        state = log_failure(job) or state
+        bins = unfinished_bins(job)
+        job['state'] = state
+        if bins == []:
+            self.finished.append(job)
+            print('Finished '+job['name']+'-'+str(job['job'])+' ('+state+')', flush=True)
+        elif job['attempt'] >= max_attempts:
+            self.given_up.append(job)
+            print('Giving up '+job['name']+'-'+str(job['job'])+' ('+state+', '+str(len(bins))+' bins unfinished)', flush=True)
+        else:
+            new_jobs = resplit(job, bins, state)
+            self.finished.append(job)
+            self.pending.extend(new_jobs)
+            print('Job '+job['name']+'-'+str(job['job'])+' ended with '+state+', resubmitting '+str(len(bins))+' bins as '+str(len(new_jobs))+' jobs', flush=True)
+
+    async def run(self):
+        await asyncio.gather(self.submitter(), self.poller())
+        self.save()
+
+##
+## Run
+##
+
+state = {}
+if state_file.is_file():
+    with open(state_file, 'r') as f:
+        state = json.load(f)
+if state.get('pending', []) != [] or state.get('active', []) != []:
+    print('Resuming from '+str(state_file), flush=True)
+    supervisor = Supervisor(state['pending'])
+    supervisor.active = {job['id']:job for job in state['active']}
+    supervisor.finished = state['finished']
+    supervisor.given_up = state['given_up']
+else:
+    jobs = []
+    for name in names:
+        current_jobs = collect_jobs(name)
+        print(name+': '+str(len(current_jobs))+' jobs', flush=True)
+        jobs += current_jobs
+    supervisor = Supervisor(jobs)
+
+start = time.time()
+asyncio.run(supervisor.run())
+
+##
+## Print what was done
+##
+
+print('----------\nFinished '+str(len(supervisor.finished))+' jobs, gave up '+str(len(supervisor.given_up))+' jobs in '+str(round(time.time()-start))+'s', flush=True)
+print('Created '+str(created_file_counter)+' files', flush=True)
+print('All done, exiting', flush=True)
@@ -0,0 +1,156 @@
+# Fused features: runs pipeline-#SSHORT.py once for every feature parameter of a job, in one process
+# The configuration lists the features under 'fused', each with its own feature parameter, gap and results folder
+# Loaded files, neighbourhoods (results of functions of toolbox.py named like 'nbhd', 'neighbourhood' or 'tribe') and eigenvalue
+# computations are cached together, up to fused_cache_bytes, so that data is read once, and a neighbourhood and its spectrum are
+# computed once for all gaps
+# Started as: python fused-#SSHORT.py <configuration .json or job array manifest.json>
+
+import os
+import sys
+import json
+import hashlib
+import weakref
+import collections
+import functools
+import tempfile
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+fused_pipeline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipeline-#SSHORT.py')
+fused_cache = collections.OrderedDict()
+fused_cache_bytes = 2**30    # Largest total size of cached results, least recently used ones are dropped beyond it
+fused_cache_total = 0
+fused_neighbourhood_names = ['nbhd', 'neighbourhood', 'neighborhood', 'tribe']
+fused_keys = {}              # Keys of arrays and matrices by id, while they exist, so that a matrix passed many times is hashed once
+
+# Loaded .npz files are kept as dictionaries, which can still be used as NpzFile objects
+class FusedNpz(dict):
+    files = property(lambda self: list(self.keys()))
+    def close(self):
+        pass
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        pass
+
+# Returns a hashable key of an argument, raises TypeError if it cannot be cached
+# Arrays and matrices are taken not to be changed in place while they are used as arguments
+def fused_key(value):
+    if isinstance(value, np.ndarray) or scipy.sparse.issparse(value):
+        known = fused_keys.get(id(value))
+        if known is not None and known[0]() is value:
+            return known[1]
+        if isinstance(value, np.ndarray):
+            key = ('array', value.shape, value.dtype.str, hashlib.sha1(np.ascontiguousarray(value).view(np.uint8)).hexdigest())
+        else:
+            matrix = scipy.sparse.csr_matrix(value)
+            key = ('sparse', matrix.shape, fused_key(matrix.data), fused_key(matrix.indices), fused_key(matrix.indptr))
+        fused_keys[id(value)] = (weakref.ref(value, lambda reference, number=id(value): fused_keys.pop(number, None)), key)
+        return key
+    if isinstance(value, (tuple, list)):
+        return tuple(fused_key(v) for v in value)
+    if isinstance(value, os.PathLike):
+        value = os.fspath(value)
+    if isinstance(value, str) and os.path.isfile(value):
+        return ('file', value, os.path.getmtime(value))
+    if value is None or isinstance(value, (str, bytes, bool, int, float, complex, np.generic)):
+        return value
+    raise TypeError('Cannot cache argument of type '+type(value).__name__)
+
+# Returns the number of bytes of a result
+def fused_size(value):
+    if isinstance(value, (tuple, list)):
+        return sum(fused_size(v) for v in value)
+    if isinstance(value, dict):
+        return sum(fused_size(v) for v in value.values())
+    if scipy.sparse.issparse(value):
+        return sum(getattr(value, name).nbytes for name in ['data', 'indices', 'indptr', 'row', 'col', 'offsets'] if isinstance(getattr(value, name, None), np.ndarray))
+    return value.nbytes if isinstance(value, np.ndarray) else 0
+
+# Returns a copy of a cached result, so that changes made by the pipeline do not change the cache
+def fused_copy(value):
+    if isinstance(value, tuple):
+        return tuple(fused_copy(v) for v in value)
+    if isinstance(value, list):
+        return [fused_copy(v) for v in value]
+    if isinstance(value, FusedNpz):
+        return FusedNpz({k:fused_copy(v) for k,v in value.items()})
+    if isinstance(value, np.ndarray) or scipy.sparse.issparse(value):
+        return value.copy()
+    return value
+
+# Returns a cached version of function, named name in the cache. Calls with arguments that cannot be cached are passed through
+def fused_wrap(function, name):
+    @functools.wraps(function)
+    def cached(*args, **kwargs):
+        global fused_cache_total
+        if kwargs.get('mmap_mode') is not None:
+            return function(*args, **kwargs)
+        try:
+            key = (name, fused_key(args), fused_key(tuple(sorted(kwargs.items()))))
+        except TypeError:
+            return function(*args, **kwargs)
+        if key not in fused_cache:
+            result = function(*args, **kwargs)
+            if isinstance(result, np.lib.npyio.NpzFile):
+                with result:
+                    result = FusedNpz({k:result[k] for k in result.files})
+            if fused_size(result) > fused_cache_bytes:
+                return result
+            fused_cache[key] = result
+            fused_cache_total += fused_size(result)
+            while fused_cache_total > fused_cache_bytes:
+                fused_cache_total -= fused_size(fused_cache.popitem(last=False)[1])
+        fused_cache.move_to_end(key)
+        return fused_copy(fused_cache[key])
+    cached.fused_wrapped = True
+    return cached
+
+# Replaces module.name by a cached version
+def fused_cached(module, name):
+    setattr(module, name, fused_wrap(getattr(module, name), module.__name__+'.'+name))
+
+# Runs code that the pipeline gives to exec() (the modified toolbox.py), then replaces its neighbourhood functions by cached versions
+# The cache is shared by the features of a job, since entries are named by the function name
+def fused_exec(source, *namespaces):
+    namespace = namespaces[0] if namespaces != () else sys._getframe(1).f_globals
+    exec(source, namespace, *namespaces[1:])
+    for name,value in list(namespace.items()):
+        if callable(value) and not isinstance(value, type) and not hasattr(value, 'fused_wrapped') and any(part in name.lower() for part in fused_neighbourhood_names):
+            namespace[name] = fused_wrap(value, 'toolbox.'+name)
+
+fused_cached(np, 'load')
+fused_cached(scipy.sparse, 'load_npz')
+for fused_module,fused_names in [(np.linalg, ['eig','eigvals','eigh','eigvalsh']), (scipy.linalg, ['eig','eigvals','eigh','eigvalsh']), (scipy.sparse.linalg, ['eigs','eigsh'])]:
+    for fused_name in fused_names:
+        fused_cached(fused_module, fused_name)
+
+# Read configuration, either a .json file or the task of a job array manifest
+with open(sys.argv[1], 'r') as f:
+    fused_config = json.load(f)
+if sys.argv[1].endswith('manifest.json'):
+    fused_task = os.environ['SLURM_ARRAY_TASK_ID']
+    fused_tasks = fused_config['tasks']
+    fused_config = fused_config['config']
+    fused_config['values']['job_order'] = int(fused_task)
+    fused_config['values']['selection_parameters'] = fused_tasks[fused_task]
+
+# Run the pipeline once per feature, with a temporary configuration
+for fused_feature in fused_config['values'].pop('fused', [{}]):
+    print('Fused feature: '+json.dumps(fused_feature), flush=True)
+    current_config = json.loads(json.dumps(fused_config))
+    for key,value in fused_feature.items():
+        if key == 'savefolder':
+            current_config['paths'][key] = value
+        else:
+            current_config['values'][key] = value
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(current_config, f)
+    sys.argv = [fused_pipeline, f.name]
+    try:
+        with open(fused_pipeline, 'r') as g:
+            exec(compile(g.read(), fused_pipeline, 'exec'), {'__name__':'__main__', '__file__':fused_pipeline, 'exec':fused_exec})
+    finally:
+        os.remove(f.name)
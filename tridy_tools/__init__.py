@@ -0,0 +1,2 @@
+# Shared helpers for the TriDy-tools scripts
+# The scripts import from here, so they are to be run from (or with) the TriDy-tools directory
@@ -0,0 +1,246 @@
+# Dependency graph of the artifacts of all four steps, used by run-pipeline.py to rebuild only what is out of date
+
+# Artifacts are named <kind>:<name>, with kinds noise, bins (partition, split order, centroids, bounds and statistics), parameters, runfiles
+# (.json, .sbatch and .sh files, modified toolbox.py and pipeline.py), results (written by the jobs, only read here) and dataframe
+# The fingerprint of an artifact hashes the configuration values it is made from, the fingerprints of the artifacts it depends on,
+# and the size and modification time of its input files (dataframe columns, templates, result files)
+# An artifact is stale if it was not built, if its fingerprint changed, if one of its files was changed or removed since, or if an artifact it depends on is stale
+# The artifacts of a partition (noise, bins, parameters, runfiles) form a branch, which does not depend on the branches of other partitions
+# Partitions that the create-bins configuration does not make are inputs, taken from their files
+
+import copy
+import os
+from functools import reduce
+from itertools import combinations
+from pathlib import Path
+from tridy_tools.catalog import config_hash, file_stat, record_artifact, artifact_info
+from tridy_tools.parameter_store import is_store, read_index
+from tridy_tools.completion import scan_folder
+from tridy_tools.create_runfiles import feature_short, group_features
+
+# Returns the size and modification time of the files of the given columns of a columnar store, or of the dataframe file
+def columns_stat(dataframe, columns):
+    if is_store(dataframe):
+        index = read_index(dataframe)
+        return [file_stat(Path(dataframe, index['columns'][column])) if column in index['columns'] else None for column in columns]
+    return file_stat(dataframe)
+
+# Returns the artifacts given by the configurations (dictionaries) of the four steps, as a list of dictionaries in dependency order
+# Each has a name, kind, branch (name of its partition), the names of the artifacts it depends on, a fingerprint (None for a missing input),
+# the configuration of the step that builds it, restricted to this artifact, and the files it is known to create before building
+def build_graph(bins_config, parameters_config, runfiles_config, results_config, df_shortdict):
+    graph = []
+    nodes = {}
+
+    def add(name, kind, branch, deps, fingerprint, config=None, outputs=[]):
+        nodes[name] = {'name':name, 'kind':kind, 'branch':branch, 'deps':deps, 'fingerprint':fingerprint, 'config':config, 'outputs':outputs}
+        graph.append(nodes[name])
+
+    def fingerprint(values, deps):
+        return config_hash({'values':values, 'deps':[nodes[dep]['fingerprint'] for dep in deps]})
+
+    # Partitions of create-bins, one per combination in sweep mode
+    values = bins_config['values']
+    paths = bins_config['paths']
+    bin_dir = paths['bin_dir']
+    dataframe = paths['dataframe']
+    sweep = bins_config.get('sweep', {})
+    if sweep.get('sweep_parameters', []) != []:
+        sweep_parameters = sweep['sweep_parameters']
+        sweep_add_noise = sweep.get('add_noise', [])
+        specs = [([sweep_parameters[i] for i in combination], [i >= len(sweep_add_noise) or sweep_add_noise[i] for i in combination], [])
+            for combination in combinations(range(len(sweep_parameters)), sweep.get('sweep_size', 2))]
+    else:
+        specs = [(values['selection_parameters'], [i >= len(values['add_noise']) or values['add_noise'][i] for i in range(len(values['selection_parameters']))], paths['noise_files'])]
+    statistics_columns = values.get('statistics_columns', []) if values.get('save_statistics', False) else []
+
+    for selection_parameters,add_noise,given_noise_files in specs:
+        name = reduce(lambda x,y: x+'_'+y,[df_shortdict[s] for s in selection_parameters])
+
+        # Noise is made with the partition, but kept when only the partition is stale, so that it is the same for a new binsize_target
+        # Given noise files are inputs
+        noise_files = []
+        noise_deps = []
+        noise_inputs = []
+        for i,s in enumerate(selection_parameters):
+            if i < len(given_noise_files) and Path(given_noise_files[i]).is_file():
+                noise_files.append(given_noise_files[i])
+                noise_inputs.append(file_stat(given_noise_files[i]))
+            elif add_noise[i]:
+                noise_file = bin_dir+'noise_'+df_shortdict[s]+'_aspartof_'+name+'.npy'
+                add('noise:'+name+':'+df_shortdict[s], 'noise', name, [], fingerprint({'parameter':s, 'data':columns_stat(dataframe, [s])}, []), outputs=[noise_file])
+                noise_files.append(noise_file)
+                noise_deps.append('noise:'+name+':'+df_shortdict[s])
+                noise_inputs.append(None)
+            else:
+                noise_files.append('')
+                noise_inputs.append(None)
+
+        config = copy.deepcopy(bins_config)
+        config['values'].update({'selection_parameters':selection_parameters, 'add_noise':add_noise, 'overwrite_existing':True})
+        config['paths']['noise_files'] = noise_files
+        config['sweep'] = {}
+        outputs = [bin_dir+'partition_'+name+'.npy', bin_dir+'split_'+name+'.npy']
+        outputs += [bin_dir+'centroids_'+name+'.npy', bin_dir+'bounds_'+name+'.npy'] if values['save_centroids'] else []
+        outputs += [bin_dir+'statistics_'+name+'.npy'] if values.get('save_statistics', False) else []
+        add('bins:'+name, 'bins', name, noise_deps, fingerprint({'selection_parameters':selection_parameters, 'add_noise':add_noise, 'binsize_target':values['binsize_target'],
+            'partitioner':values.get('partitioner', 'kdtree'), 'chunk_size':values.get('chunk_size', 0), 'save_centroids':values['save_centroids'],
+            'statistics_columns':statistics_columns, 'data':columns_stat(dataframe, selection_parameters+statistics_columns), 'noise':noise_inputs}, noise_deps), config, outputs)
+
+    # Returns the name of the bins artifact of a partition, added as an input if create-bins does not make it
+    def partition_artifact(name, bin_dir):
+        if 'bins:'+name not in nodes:
+            partition_file = bin_dir+'partition_'+name+'.npy'
+            add('bins:'+name, 'input', name, [], None if file_stat(partition_file) is None else config_hash(file_stat(partition_file)), outputs=[partition_file])
+        return 'bins:'+name
+
+    # Binary parameters of every partition of create-parameters
+    for name in parameters_config['values']['selection_parameter_names']:
+        config = copy.deepcopy(parameters_config)
+        config['values']['selection_parameter_names'] = [name]
+        deps = [partition_artifact(name, parameters_config['paths']['bin_dir'])]
+        add('parameters:'+name, 'parameters', name, deps, fingerprint({'storage_format':config['values'].get('storage_format', 'dense'), 'parameter_dir':config['paths']['parameter_dir']}, deps), config)
+
+    # Job files of every partition and (group of) feature parameters of create-runfiles, then the results and dataframe of every feature parameter
+    values = runfiles_config['values']
+    paths = runfiles_config['paths']
+    feature_groups = group_features(values['feature_parameters'], values.get('fuse_features', False))
+    templates = [paths['json_template'], paths['sbatch_template'], paths['tridy_dir']+'toolbox.py', paths['tridy_dir']+'pipeline.py']
+    templates += [paths.get('fused_template', './templates/fused.py')] if any(len(group) > 1 for group in feature_groups) else []
+    costs = None
+    if values.get('packing', 'even') == 'lpt' or values.get('right_size', False):
+        costs = columns_stat(paths.get('dataframe', './data/parameters.pkl'), [values.get('cost_column', 'tribe_size')])
+    for name in values['selection_parameters']:
+        deps = [partition_artifact(name, paths['bin_dir'])]+(['parameters:'+name] if 'parameters:'+name in nodes else [])
+        for group in feature_groups:
+            shorts = [feature_short(values['feature_parameters'][k], df_shortdict) for k in group]
+            collection = name+'-'+reduce(lambda x,y: x+'+'+y, shorts)
+            config = copy.deepcopy(runfiles_config)
+            config['values'].update({'selection_parameters':[name], 'feature_parameters':[values['feature_parameters'][k] for k in group], 'num_jobs':[values['num_jobs'][k] for k in group]})
+            add('runfiles:'+collection, 'runfiles', name, deps, fingerprint({'values':{k:v for k,v in config['values'].items() if k != 'profile'},
+                'paths':{k:v for k,v in paths.items() if k not in ['span_file', 'catalog']}, 'templates':[file_stat(template) for template in templates], 'costs':costs}, deps), config)
+
+            for short in shorts:
+                member = name+'-'+short
+                folder = Path(results_config['results_dir'], member)
+                results = scan_folder(folder)['results'] if folder.is_dir() else {}
+                add('results:'+member, 'results', name, ['runfiles:'+collection], None if results == {} else config_hash(results))
+                config = copy.deepcopy(results_config)
+                config.update({'collections':[member], 'overwrite_existing':True})
+                dataframe_deps = ['results:'+member, 'bins:'+name]
+                add('dataframe:'+member, 'dataframe', name, dataframe_deps, fingerprint({k:v for k,v in results_config.items() if k not in ['profile', 'span_file', 'num_processes', 'collections', 'catalog']},
+                    dataframe_deps), config, [results_config['dataframe_dir']+member+'.pkl'])
+    return graph
+
+# Returns a dictionary from the name of every artifact to the reason it is stale, or None if it is up to date
+# Inputs and results are never stale, an artifact with a missing input (partition file, or results not yet written) stays stale
+def stale_artifacts(graph, catalog):
+    stale = {}
+    fingerprints = {node['name']:node['fingerprint'] for node in graph}
+    for node in graph:
+        reason = None
+        if node['kind'] not in ['input', 'results']:
+            info = artifact_info(catalog, node['name'])
+            missing = [dep for dep in node['deps'] if fingerprints[dep] is None]
+            changed = [] if info is None else [file for file,stat in info['outputs'].items() if (file_stat(file) != stat if stat is not None else not os.path.isfile(file))]
+            stale_deps = [dep for dep in node['deps'] if stale[dep] is not None]
+            if missing != []:
+                reason = 'missing '+missing[0]
+            elif info is None:
+                reason = 'not built'
+            elif info['fingerprint'] != node['fingerprint']:
+                reason = 'configuration or inputs changed'
+            elif changed != []:
+                reason = 'file changed or removed: '+changed[0]
+            elif stale_deps != []:
+                reason = 'depends on '+stale_deps[0]
+        stale[node['name']] = reason
+    return stale
+
+# Removes files, skipping those that do not exist
+def remove_files(files):
+    for file in files:
+        if os.path.isfile(file):
+            os.remove(file)
+
+# Returns the files of the binary parameters of a partition with num_bins bins, as written by create_parameters()
+def parameter_files(config, num_bins):
+    prefix = config['paths']['parameter_dir']+config['values']['selection_parameter_names'][0]
+    storage_format = config['values'].get('storage_format', 'dense')
+    if storage_format == 'dense':
+        return [prefix+'-'+str(i)+'.npy' for i in range(num_bins)]
+    if storage_format == 'packed':
+        return [prefix+'-packed.npy', prefix+'-layout.json']
+    return [prefix+'-indices.npy', prefix+'-indptr.npy', prefix+'-layout.json']
+
+# Returns the files of a job collection, as written by create_runfiles() for its jobs
+# and the modified toolbox.py, pipeline.py and fused.py files, which are shared by all job collections of the partition
+def runfile_files(config, collection, jobs):
+    paths = config['paths']
+    sparam = config['values']['selection_parameters'][0]
+    shared = [paths['runfile_dir']+'toolbox-'+sparam+'.py', paths['runfile_dir']+'pipeline-'+sparam+'.py', paths['runfile_dir']+'fused-'+sparam+'.py']
+    files = [paths['runfile_dir']+collection+'.sh']
+    if config['values'].get('job_array', False):
+        files += [paths['config_dir']+collection+'/manifest.json', paths['sbatch_dir']+collection+'/array.sbatch']
+    else:
+        for job_num in range(len(jobs.get(collection, []))):
+            files += [paths['config_dir']+collection+'/'+str(job_num)+'.json', paths['sbatch_dir']+collection+'/'+str(job_num)+'.sbatch']
+    return ([file for file in files if os.path.isfile(file)], [file for file in shared if os.path.isfile(file)])
+
+# Builds the stale artifacts of one branch in order, given as a task (artifacts, catalog), and records each in the catalog
+# Partitions are handed from create_bins() to create_parameters() and create_runfiles() in memory
+# Files recorded for an artifact before, but not written by the new build, are removed, for example .json files of jobs that no longer exist
+# Returns the names of the built artifacts, and an error message if building stopped early (later artifacts of the branch are then not built)
+def build_branch(task):
+    from tridy_tools.create_bins import create_bins
+    from tridy_tools.create_parameters import create_parameters
+    from tridy_tools.create_runfiles import create_runfiles
+    nodes,catalog = task
+    partitions = {}
+    built = []
+    for node in nodes:
+        previous = artifact_info(catalog, node['name'])
+        previous_outputs = [] if previous is None else [file for file,stat in previous['outputs'].items() if stat is not None]
+        shared = []
+        try:
+            # A stale noise file is removed, so that create_bins() makes a new one with the partition
+            if node['kind'] == 'noise':
+                remove_files(previous_outputs)
+                continue
+            elif node['kind'] == 'bins':
+                partitions,_ = create_bins(node['config'], verbose=False)
+                outputs = [file for file in node['outputs'] if os.path.isfile(file)]
+            elif node['kind'] == 'parameters':
+                matrices,_ = create_parameters(node['config'], partitions, verbose=False)
+                outputs = parameter_files(node['config'], len(matrices[node['branch']][0])-1)
+            else:
+                collection = node['name'].split(':', 1)[1]
+                jobs,_,_ = create_runfiles(node['config'], partitions, verbose=False)
+                outputs,shared = runfile_files(node['config'], collection, jobs)
+        except Exception as error:
+            return (built, node['name']+': '+repr(error))
+        remove_files([file for file in previous_outputs if file not in outputs])
+        record_artifact(catalog, node['name'], node['fingerprint'], outputs, shared)
+        built.append(node['name'])
+
+        # Noise is recorded with its partition
+        if node['kind'] == 'bins':
+            for noise in [n for n in nodes if n['name'] in node['deps']]:
+                record_artifact(catalog, noise['name'], noise['fingerprint'], [file for file in noise['outputs'] if os.path.isfile(file)])
+                built.append(noise['name'])
+    return (built, None)
+
+# Collects the results of stale dataframes, in one call of collect_results() for all of them, and records those that were exported
+# Dataframes of incomplete results are not exported (unless collect_incomplete is set), and stay stale
+# Returns the names of the built artifacts
+def build_dataframes(nodes, catalog):
+    from tridy_tools.collect_results import collect_results
+    config = copy.deepcopy(nodes[0]['config'])
+    config['collections'] = [node['name'].split(':', 1)[1] for node in nodes]
+    dataframes,_ = collect_results(config, verbose=False)
+    built = []
+    for node in nodes:
+        if node['name'].split(':', 1)[1] in dataframes:
+            record_artifact(catalog, node['name'], node['fingerprint'], node['outputs'])
+            built.append(node['name'])
+    return built
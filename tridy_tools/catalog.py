@@ -0,0 +1,146 @@
+# Catalog of the artifacts of all steps, in a local SQLite database
+
+# Records partitions (bins and their sizes, configuration hash, noise files), binary parameter files, generated jobs and their bins,
+# and collected classification results, so that later steps look these up by indexed queries instead of loading arrays or listing folders
+# Also records the artifacts built by run-pipeline.py, with the fingerprint they were built from and the size and modification time of their files
+# A partition is only taken from the catalog if its file still has the recorded size and modification time, otherwise it is loaded again
+# The database is opened in WAL mode, so that processes (for example the sweep of create-bins.py) can write to it at the same time
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+schema = '''
+create table if not exists partitions (name text primary key, num_bins integer, nnum integer, file text, file_size integer,
+    file_mtime real, config_hash text, noise_files text, created real);
+create table if not exists bins (partition text, bin integer, size integer, primary key (partition, bin));
+create table if not exists parameter_files (partition text primary key, storage_format text, location text, num_bins integer, nnum integer, created real);
+create table if not exists jobs (collection text, job integer, partition text, fshort text, created real, primary key (collection, job));
+create table if not exists job_bins (collection text, job integer, partition text, bin integer);
+create index if not exists job_bins_bin on job_bins (partition, bin);
+create table if not exists results (partition text, fshort text, bin integer, cv_acc real, cv_err real, test_acc real, test_err real,
+    nonzero_count integer, total_count integer, seconds real);
+create index if not exists results_bin on results (partition, fshort, bin);
+create table if not exists artifacts (name text primary key, fingerprint text, outputs text, built real);
+'''
+
+# Returns a connection to the catalog, creating its tables if necessary
+def connect(catalog):
+    connection = sqlite3.connect(catalog, timeout=60)
+    connection.execute('pragma journal_mode=wal')
+    connection.executescript(schema)
+    return connection
+
+# Returns a hash of a configuration (any JSON serialisable value)
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+# Records a partition saved in partition_file, with the sizes of its bins
+def record_partition(catalog, name, partition_file, partition, nnum, config_hash=None, noise_files=None):
+    stat = os.stat(partition_file)
+    connection = connect(catalog)
+    with connection:
+        connection.execute('insert or replace into partitions values (?,?,?,?,?,?,?,?,?)',
+            (name, len(partition), nnum, str(partition_file), stat.st_size, stat.st_mtime, config_hash, json.dumps(noise_files), time.time()))
+        connection.execute('delete from bins where partition = ?', (name,))
+        connection.executemany('insert into bins values (?,?,?)', [(name, i, len(b)) for i,b in enumerate(partition)])
+    connection.close()
+
+# Returns the record of a partition as a dictionary, or None if it is not recorded or partition_file changed since
+def partition_info(catalog, name, partition_file):
+    if not os.path.isfile(catalog) or not os.path.isfile(partition_file):
+        return None
+    connection = connect(catalog)
+    connection.row_factory = sqlite3.Row
+    row = connection.execute('select * from partitions where name = ?', (name,)).fetchone()
+    connection.close()
+    if row is None:
+        return None
+    stat = os.stat(partition_file)
+    if row['file_size'] != stat.st_size or row['file_mtime'] != stat.st_mtime:
+        return None
+    return dict(row)
+
+# Returns the sizes of the bins of a recorded partition, as an array
+def bin_sizes(catalog, name):
+    connection = connect(catalog)
+    sizes = connection.execute('select size from bins where partition = ? order by bin', (name,)).fetchall()
+    connection.close()
+    return np.array([size for size, in sizes], dtype=int)
+
+# Records the binary parameter files of a partition
+def record_parameters(catalog, name, storage_format, location, num_bins, nnum):
+    connection = connect(catalog)
+    with connection:
+        connection.execute('insert or replace into parameter_files values (?,?,?,?,?,?)', (name, storage_format, str(location), num_bins, nnum, time.time()))
+    connection.close()
+
+# Records the jobs of a collection <sparam>-<fshort>, replacing earlier jobs of the same collection
+# job_list is a list of lists of bins, one per job
+def record_jobs(catalog, collection, sparam, fshort, job_list):
+    connection = connect(catalog)
+    with connection:
+        connection.execute('delete from jobs where collection = ?', (collection,))
+        connection.execute('delete from job_bins where collection = ?', (collection,))
+        connection.executemany('insert into jobs values (?,?,?,?,?)', [(collection, job_num, sparam, fshort, time.time()) for job_num in range(len(job_list))])
+        connection.executemany('insert into job_bins values (?,?,?,?)', [(collection, job_num, sparam, int(b)) for job_num,bins in enumerate(job_list) for b in bins])
+    connection.close()
+
+# Records the collected results of sparam and fshort (a dataframe from collect-results.py), replacing earlier ones
+def record_results(catalog, sparam, fshort, df):
+    columns = ['bin_number', 'cv_acc', 'cv_err', 'test_acc', 'test_err', 'nonzero_count', 'total_count', 'seconds']
+    rows = zip(*[df[column].tolist() for column in columns])
+    connection = connect(catalog)
+    with connection:
+        connection.execute('delete from results where partition = ? and fshort = ?', (sparam, fshort))
+        connection.executemany('insert into results values (?,?,?,?,?,?,?,?,?,?)', [(sparam, fshort)+tuple(row) for row in rows])
+    connection.close()
+
+# Returns the bins of a recorded partition without collected results for fshort
+def missing_bins(catalog, sparam, fshort):
+    connection = connect(catalog)
+    bins = connection.execute('select bin from bins where partition = ? and bin not in (select bin from results where partition = ? and fshort = ?) order by bin',
+        (sparam, sparam, fshort)).fetchall()
+    connection.close()
+    return [b for b, in bins]
+
+# Returns the job of a collection that a bin was assigned to, or None
+def job_of_bin(catalog, collection, sparam, b):
+    connection = connect(catalog)
+    row = connection.execute('select job from job_bins where collection = ? and partition = ? and bin = ?', (collection, sparam, b)).fetchone()
+    connection.close()
+    return None if row is None else row[0]
+
+# Returns [size, modification time] of a file, or None if it does not exist
+def file_stat(file):
+    if not os.path.isfile(file):
+        return None
+    stat = os.stat(file)
+    return [stat.st_size, stat.st_mtime]
+
+# Records an artifact of run-pipeline.py, built from fingerprint, with the size and modification time of its output files, replacing an earlier record
+# Files in shared are also written by other artifacts, so only their existence is recorded (with None)
+def record_artifact(catalog, name, fingerprint, outputs, shared=[]):
+    files = {str(file):file_stat(file) for file in outputs}
+    files.update({str(file):None for file in shared})
+    connection = connect(catalog)
+    with connection:
+        connection.execute('insert or replace into artifacts values (?,?,?,?)', (name, fingerprint, json.dumps(files), time.time()))
+    connection.close()
+
+# Returns the record of an artifact as a dictionary, with outputs from file to [size, modification time] (None for shared files), or None if it is not recorded
+def artifact_info(catalog, name):
+    if not os.path.isfile(catalog):
+        return None
+    connection = connect(catalog)
+    connection.row_factory = sqlite3.Row
+    row = connection.execute('select * from artifacts where name = ?', (name,)).fetchone()
+    connection.close()
+    if row is None:
+        return None
+    info = dict(row)
+    info['outputs'] = json.loads(info['outputs'])
+    return info
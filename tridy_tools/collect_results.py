@@ -0,0 +1,216 @@
+# Step 4 of 4 (collect-results.py) as a function: collects the classification results of the jobs created in step 3 into pandas dataframes
+
+# collect_results() takes the configuration as a dictionary, in the format of collect-results.config, and returns the exported dataframes
+# Results are read from the result records (.jsonl) written by the modified pipeline.py, or from the .txt files created by running TriDy if there are none
+# pandas is only imported when collecting
+
+import json
+import os
+import multiprocessing as mp
+from pathlib import Path
+import numpy as np
+from tridy_tools.completion import update_completion, scan_folder
+from tridy_tools.results_store import write_partition
+from tridy_tools.catalog import partition_info, record_partition, record_results
+from tridy_tools.spans import configure, section, start_span, end_span, end_section
+
+columns = ['bin_number', 'cv_acc', 'cv_err', 'test_acc', 'test_err', 'nonzero_count', 'total_count', 'seconds']
+text_prefix = 'classification_accuracies_'
+record_prefix = 'classification_records_'
+
+# Function to extract numbers from TriDy results. Naive implementation
+# Works for commit c622760 and for earlier verions
+def extract_numbers(string):
+    number_list = []
+    current_index = 0
+    current_number = ''
+    at_number = False
+    while current_index < len(string):
+        if string[current_index] in ['0','1','2','3','4','5','6','7','8','9','.']:
+            current_number += string[current_index]
+            at_number = True
+        elif at_number == True:
+            number_list.append(float(current_number))
+            current_number = ''
+            at_number = False
+        current_index += 1
+    # Catch if number at the end
+    if at_number == True:
+        number_list.append(float(current_number))
+    return number_list
+
+# Returns the classification results of a .txt file, as a list of dictionaries
+def read_text(text_file):
+    f = open(text_file,'r')
+    lines = f.readlines()
+    f.close()
+
+    current_results = []
+    for line_index,line in enumerate(lines):
+        if line[:2].lower() == 'cv':
+            current_numbers = extract_numbers(line)
+            current_results.append({
+                'bin_number':int(lines[line_index-1].split('-')[-1]),
+                'cv_acc':current_numbers[0], 'cv_err':current_numbers[1], 'test_acc':current_numbers[2], 'test_err':current_numbers[3],
+                'nonzero_count':int(current_numbers[4]), 'total_count':int(current_numbers[5]), 'seconds':np.nan
+                })
+    return current_results
+
+# Returns the classification results of a .jsonl file of result records, as a list of dictionaries, or None if a record has an error
+def read_records(record_file):
+    with open(record_file,'r') as f:
+        records = [json.loads(line) for line in f if line.strip() != '']
+    if any('error' in record for record in records):
+        return None
+    return [{column:record[column] for column in columns} for record in records]
+
+# Returns the classification results of a text file, from its records if given and readable, and whether the text was parsed
+def parse_file(task):
+    directory,text_file,record_file = task
+    file_results = read_records(directory+record_file) if record_file is not None else None
+    if file_results is None:
+        return read_text(directory+text_file), True
+    return file_results, False
+
+# Collects the results of the job collections in results_dir, as given by config_dict (the content of a collect-results.config file), and exports them to dataframe_dir
+# Returns a dictionary from the name of every exported job collection (<sparam>-<fshort>) to its dataframe, and the number of created files
+def collect_results(config_dict, verbose=True):
+    import pandas as pd
+    log = print if verbose else (lambda *args, **kwargs: None)
+
+    overwrite_existing = config_dict['overwrite_existing']       # Whether or not to overwrite existing dataframes. Default is False.
+    collect_incomplete = config_dict['collect_incomplete']       # Whether or not to collect classification results from jobs that do not have all results. Default is False.
+    bin_dir = config_dict['bin_dir']                             # Directory to which bins have been exported. Only relevant if collect_incomplete is true. Default is ./bins/
+    results_dir = config_dict['results_dir']                     # Where the classification results are located. Default is ./results/
+    dataframe_dir = config_dict['dataframe_dir']                 # Where to export the dataframe. Default is ./dataframes/
+    incremental = config_dict.get('incremental', True)           # Whether or not to parse only new or changed files, and update dataframes created by earlier incremental collections. Default is True
+    num_processes = config_dict.get('num_processes', mp.cpu_count())   # Number of processes parsing files at the same time. Default is the number of CPUs
+    export_store = config_dict.get('export_store', True)         # Whether or not to also add every exported dataframe as a partition of the results store. Default is True
+    catalog = config_dict.get('catalog', './catalog.sqlite')     # Catalog of partitions, from which numbers of bins are read, and in which collected results are recorded. Default is ./catalog.sqlite
+    results_store = config_dict.get('results_store', './results-store/')   # Location of the results store, see tridy_tools/results_store.py for queries. Default is ./results-store/
+    span_file = config_dict.get('span_file', './out-err/spans.jsonl')   # File to which wall and CPU time, peak memory, and bytes and files written of each section are appended, as JSON lines. Default is ./out-err/spans.jsonl
+    collections = config_dict.get('collections', None)          # List of results folders (<sparam>-<fshort>) to collect. Default is None (all folders in results_dir)
+    profile = config_dict.get('profile', False)                 # Whether or not to run under cProfile, saved next to span_file as collect-results-<time>.prof. Default is False
+
+    created_file_counter = 0
+    configure(span_file, profile, files=lambda: created_file_counter, stage='collect-results')
+
+    # Returns the location of the collection state of a results folder
+    def state_file(param):
+        return Path(dataframe_dir+param+'-collected.json')
+
+    # Returns the collection state of a results folder, from text file name to sizes and modification times (of text and records) and results
+    def read_state(param):
+        if not state_file(param).is_file():
+            return {}
+        with open(state_file(param), 'r') as f:
+            return json.load(f)
+
+    def write_state(param, state):
+        temporary = Path(str(state_file(param))+'.'+str(os.getpid()))
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, state_file(param))
+
+    # Get names of results to collect
+    section('get names of results to collect')
+    # Folders are listed from the completion index, which is updated first
+    # Existing dataframes are skipped, unless overwritten or created by an earlier incremental collection
+    completion = update_completion(results_dir)
+    paramater_names = sorted(name for name in completion if collections is None or name in collections)
+    if not overwrite_existing:
+        already_computed = [filename.split('.')[0] for filename in list(os.walk(dataframe_dir))[0][2]]
+        for param in already_computed:
+            if param in paramater_names and not (incremental and state_file(param).is_file()):
+                paramater_names.remove(param)
+
+    # Find new or changed text files
+    section('find new or changed text files')
+    # Results of a text file are read from its records if these exist and can all be read, otherwise from the text
+    # Folders are scanned again, since files written to in place do not change the modification time of their folder
+    states = {}
+    tasks = []
+    for param in paramater_names:
+        all_files = scan_folder(results_dir+param)['results']
+        previous_state = read_state(param) if incremental and not overwrite_existing else {}
+        states[param] = {}
+        for file in sorted(file for file in all_files if file.endswith('.txt')):
+            record_file = record_prefix+file[len(text_prefix):-len('.txt')]+'.jsonl'
+            if not (file.startswith(text_prefix) and record_file in all_files):
+                record_file = None
+            current_stat = [all_files[file], all_files.get(record_file)]
+            if file in previous_state and previous_state[file]['stat'] == current_stat:
+                states[param][file] = previous_state[file]
+            else:
+                states[param][file] = {'stat':current_stat}
+                tasks.append((param, file, record_file))
+
+    log('Parsing '+str(len(tasks))+' new or changed text files with '+str(num_processes)+' processes', flush=True)
+    changed_names = set()
+    num_fallback = 0
+    if tasks != []:
+        current_span = start_span('parse', num_files=len(tasks), num_processes=num_processes)
+        with mp.get_context('fork').Pool(num_processes) as pool:
+            parsed = pool.imap(parse_file, [(results_dir+param+'/', file, record_file) for param,file,record_file in tasks], chunksize=16)
+            for (param,file,record_file),(file_results,fallback) in zip(tasks, parsed):
+                states[param][file]['results'] = file_results
+                changed_names.add(param)
+                num_fallback += fallback
+        end_span(current_span, num_fallback=num_fallback)
+    log(str(num_fallback)+' files without (readable) records', flush=True)
+
+    # Export dataframes
+    section('export dataframes')
+    dataframes = {}
+    for param in paramater_names:
+        log(param, flush=True)
+        current_span = start_span('export', collection=param)
+        current_files = sorted(states[param])
+        log('Found '+str(len(current_files))+' text files, '+str(len([task for task in tasks if task[0] == param]))+' new or changed', flush=True)
+        target_file = Path(dataframe_dir+param+'.pkl')
+
+        if current_files == []:
+            log('No results exist, skipping', flush=True)
+        elif param not in changed_names and target_file.is_file() and state_file(param).is_file():
+            log('No new or changed files, skipping', flush=True)
+        else:
+            current_results = [result for file in current_files for result in states[param][file]['results']]
+            current_dict = {column:[result[column] for result in current_results] for column in columns}
+
+            log('Read '+str(len(current_dict['bin_number']))+' classification results', flush=True)
+            if not collect_incomplete:
+                sparam = param.split('-')[0]
+                expected_bins = bin_dir+'partition_'+sparam+'.npy'
+                info = partition_info(catalog, sparam, expected_bins)
+                if info is not None:
+                    num_bins = info['num_bins']
+                else:
+                    try:
+                        current_bins = np.load(expected_bins,allow_pickle=True)
+                        num_bins = len(current_bins)
+                    except:
+                        assert False, 'Expected bin file '+expected_bins+' not found. Check bin_dir in config file.'
+                    record_partition(catalog, sparam, expected_bins, current_bins, sum(len(b) for b in current_bins))
+
+            if (not collect_incomplete) and (num_bins != len(current_dict['bin_number'])):
+                log('This is less than complete number ('+str(num_bins)+'), skipping', flush=True)
+            else:
+                df = pd.DataFrame.from_dict(current_dict)
+                if not overwrite_existing and not (incremental and state_file(param).is_file()):
+                    assert not target_file.is_file(), 'Dataframe file exists, but config file says to not overwrite. Delete or rename dataframe, or change config file.'
+                df.to_pickle(target_file)
+                dataframes[param] = df
+                created_file_counter += 1
+                sparam,_,fshort = param.partition('-')
+                record_results(catalog, sparam, fshort, df)
+                if export_store:
+                    created_file_counter += write_partition(results_store, sparam, fshort, df)
+
+            # The state is saved even if the dataframe is not, so that files are not parsed again
+            if incremental:
+                write_state(param, states[param])
+                created_file_counter += 1
+        end_span(current_span)
+
+    end_section()
+    return (dataframes, created_file_counter)
@@ -0,0 +1,127 @@
+# Completion index of the results directory
+
+# Records, for every results folder <sparam>-<fshort>, which bins have feature vectors (loose or archived, see vector_archive.py) and which classification result files exist
+# The index is saved as completion.json in the results directory
+# A folder is scanned again only if its modification time changed, that is, if files were added or removed since the last scan
+# With classified, the bins classified in every text file of results are recorded too. Text files are appended to while jobs run,
+# so each is read again if its size or modification time changed
+
+import json
+import os
+from pathlib import Path
+
+index_name = 'completion.json'
+feature_suffix = '_feature_vectors.npy'
+
+# Returns the saved index of results_dir, or an empty index
+def read_completion(results_dir):
+    location = Path(results_dir, index_name)
+    if not location.is_file():
+        return {}
+    with open(location, 'r') as f:
+        return json.load(f)
+
+# Saves the index, through a temporary file so that readers never see a partial index
+def write_completion(results_dir, index):
+    location = Path(results_dir, index_name)
+    temporary = Path(results_dir, index_name+'.'+str(os.getpid()))
+    with open(temporary, 'w') as f:
+        json.dump(index, f)
+    os.replace(temporary, location)
+
+# Returns the entry of one results folder: its modification time, bins with feature vectors, and result files (text and records) with size and modification time
+def scan_folder(folder):
+    from tridy_tools.vector_archive import archive_index_name, read_archive_index
+    entry = {'mtime':os.stat(folder).st_mtime, 'feature_vectors':{}, 'results':{}}
+    names = set()
+    with os.scandir(folder) as it:
+        for file in it:
+            if file.name.endswith(feature_suffix):
+                names.add(file.name[:-len(feature_suffix)])
+            elif file.name == archive_index_name:
+                names.update(read_archive_index(folder))
+            elif file.name.endswith('.txt') or file.name.endswith('.jsonl'):
+                stat = file.stat()
+                entry['results'][file.name] = [stat.st_size, stat.st_mtime]
+    for name in names:
+        sparam,_,current_bin = name.rpartition('-')
+        if current_bin.isdigit():
+            entry['feature_vectors'].setdefault(sparam, []).append(int(current_bin))
+    for sparam in entry['feature_vectors']:
+        entry['feature_vectors'][sparam].sort()
+    return entry
+
+# Returns the names (<sparam>-<i>) of the bins classified in a text file of results, the lines before complete lines starting with 'cv'
+def read_classified(text_file):
+    bins = []
+    previous = ''
+    with open(text_file, 'r', errors='replace') as f:
+        for line in f:
+            if line[:2].lower() == 'cv' and line.endswith('\n'):
+                bins.append(previous.strip())
+            previous = line
+    return bins
+
+# Updates the classified bins of the entry of a results folder, from its text files that changed since the last update
+# Returns whether the entry was changed
+def update_classified(folder, entry):
+    classified = entry.setdefault('classified', {})
+    changed = False
+    for name in set(classified)-set(entry['results']):
+        del classified[name]
+        changed = True
+    for name in entry['results']:
+        if not name.endswith('.txt'):
+            continue
+        try:
+            stat = os.stat(Path(folder, name))
+        except OSError:
+            continue
+        if classified.get(name, [None, None])[:2] != [stat.st_size, stat.st_mtime]:
+            classified[name] = [stat.st_size, stat.st_mtime, read_classified(Path(folder, name))]
+            changed = True
+    return changed
+
+# Updates the index of results_dir and returns it. If names is given, only these folders are updated, otherwise all folders
+# Folders that were not changed since the last scan are not scanned again. With classified, classified bins are updated too
+def update_completion(results_dir, names=None, save=True, classified=False):
+    index = read_completion(results_dir)
+    if names is None:
+        with os.scandir(results_dir) as it:
+            names = [folder.name for folder in it if folder.is_dir()]
+        for name in set(index)-set(names):
+            del index[name]
+    changed = False
+    for name in names:
+        folder = Path(results_dir, name)
+        if not folder.is_dir():
+            changed = changed or index.pop(name, None) is not None
+            continue
+        if name not in index or index[name]['mtime'] != os.stat(folder).st_mtime:
+            previous = index.get(name, {}).get('classified', {})
+            index[name] = scan_folder(folder)
+            index[name]['classified'] = previous
+            changed = True
+        if classified:
+            changed = update_classified(folder, index[name]) or changed
+    if save and changed:
+        write_completion(results_dir, index)
+    return index
+
+# Returns the set of bins of sparam with feature vectors in results folder name
+def featurised_bins(index, name, sparam):
+    return set(index.get(name, {}).get('feature_vectors', {}).get(sparam, []))
+
+# Returns the set of bins of sparam with classification results in results folder name, as recorded by update_completion with classified
+def classified_bins(index, name, sparam):
+    bins = set()
+    for size,mtime,names in index.get(name, {}).get('classified', {}).values():
+        for current_name in names:
+            current_sparam,_,current_bin = current_name.rpartition('-')
+            if current_sparam == sparam and current_bin.isdigit():
+                bins.add(int(current_bin))
+    return bins
+
+# Returns the dictionary of result files (.txt and .jsonl) in results folder name, from file name to [size, modification time]
+def result_files(index, name):
+    return index.get(name, {}).get('results', {})
@@ -0,0 +1,500 @@
+# Step 1 of 4 (create-bins.py) as a function: partitions neurons into bins, using k selection parameters and a kd-tree or median splits
+
+# create_bins() takes the configuration as a dictionary, in the format of create-bins.config, and returns the created partitions
+# These can be passed on to create_parameters() and create_runfiles(), which then do not load them again
+# scipy is only imported when a kd-tree is built
+
+import pickle
+from functools import reduce
+from pathlib import Path
+from itertools import combinations
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from numpy.lib.format import open_memmap
+from tridy_tools.parameter_store import load_columns, is_store, num_neurons
+from tridy_tools.scheduling import bin_layout, reduce_bins
+from tridy_tools.catalog import record_partition, config_hash
+from tridy_tools.spans import configure, section, start_span, end_span, end_section
+
+# Reutrns partition. Modified from code suggested by Michael W. Reimann
+def return_partition(tree, verbose=True, save_split=False):
+    global partition_size
+    global split_order
+    partition_size = []
+    split_order = []
+    leaf_size(tree.tree, '')
+    if verbose:
+        print('Partitioned into {0} bins, of {1} different sizes ({2} to {3})'.format(
+            len(partition_size),
+            len(np.unique(np.array(partition_size))),
+            min(partition_size),
+            max(partition_size)
+        ))
+    partition_size_sums = [sum(partition_size[:k]) for k in range(len(partition_size)+1)]
+    split = [tree.indices[partition_size_sums[k]:partition_size_sums[k+1]] for k in range(len(partition_size))]
+    if save_split:
+        return (split, split_order)
+    else:
+        return split
+
+def leaf_size(tree, order_string):
+    if hasattr(tree, "greater"):
+        leaf_size(tree.less, order_string+'l')
+        leaf_size(tree.greater, order_string+'g')
+    else:
+        partition_size.append(tree.children)
+        split_order.append(order_string)
+
+# Returns balanced partition, by iterated median splits along the dimension of largest spread
+# Number of bins is 2^n for the smallest integer n such that (number of points)/2^n <= binsize_target, or 2^depth if depth is given
+def median_partition(vector, binsize_target, verbose=True, depth=None):
+    if depth is None:
+        depth = 0
+        while len(vector)/2**depth > binsize_target:
+            depth += 1
+    split = [np.arange(len(vector))]
+    split_order = ['']
+    for level in range(depth):
+        new_split = []
+        new_order = []
+        for b,order_string in zip(split, split_order):
+            current_values = vector[b]
+            dim = np.argmax(np.max(current_values, axis=0)-np.min(current_values, axis=0))
+            half = len(b)//2
+            current_order = np.argpartition(current_values[:,dim], half)
+            new_split += [b[current_order[:half]], b[current_order[half:]]]
+            new_order += [order_string+'l', order_string+'g']
+        split = new_split
+        split_order = new_order
+    if verbose:
+        partition_size = [len(b) for b in split]
+        print('Partitioned into {0} bins, of {1} different sizes ({2} to {3})'.format(
+            len(partition_size),
+            len(np.unique(np.array(partition_size))),
+            min(partition_size),
+            max(partition_size)
+        ))
+    return (split, split_order)
+
+# Returns the same partition as median_partition, reading vector (neurons x k, usually a memory map) in blocks of chunk_size neurons
+# The neurons of every bin are kept next to each other in an order array. A bin larger than chunk_size is split in two passes over its blocks:
+# one for the dimension of largest spread, and one moving the neurons below and above the median to either end of the bin
+# The median is found from a random sample of the bin, so only the neurons between two sample quantiles around it are held in memory
+# Bins of at most chunk_size neurons are loaded and split further by median_partition
+def chunked_median_partition(vector, binsize_target, chunk_size, verbose=True):
+    nnum = len(vector)
+    depth = 0
+    while nnum/2**depth > binsize_target:
+        depth += 1
+    rng = np.random.default_rng()
+    order = np.arange(nnum)
+    new_order = np.empty_like(order)
+    segments = [(0, nnum, '')]
+    bins = []
+    for level in range(depth+1):
+        new_segments = []
+        for start,end,order_string in segments:
+            if level == depth:
+                bins.append((order_string, order[start:end].copy()))
+                continue
+            if end-start <= chunk_size:
+                current_neurons = np.sort(order[start:end])
+                current_split,current_order = median_partition(vector[current_neurons], binsize_target, verbose=False, depth=depth-level)
+                bins += [(order_string+o, current_neurons[b]) for b,o in zip(current_split, current_order)]
+                continue
+
+            # Dimension of largest spread
+            current_min = np.full(vector.shape[1], np.inf)
+            current_max = np.full(vector.shape[1], -np.inf)
+            for block_start in range(start, end, chunk_size):
+                rows = vector[np.sort(order[block_start:min(end,block_start+chunk_size)])]
+                current_min = np.minimum(current_min, np.min(rows, axis=0))
+                current_max = np.maximum(current_max, np.max(rows, axis=0))
+            dim = np.argmax(current_max-current_min)
+
+            # Sample quantiles around the median, about 8 standard deviations apart
+            half = (end-start)//2
+            sample = np.sort(vector[np.sort(order[rng.integers(start, end, chunk_size)]), dim])
+            margin = 4/np.sqrt(chunk_size)
+            lower = sample[int(max(0, half/(end-start)-margin)*(chunk_size-1))]
+            upper = sample[int(min(1, half/(end-start)+margin)*(chunk_size-1))]
+
+            # Move neurons below lower to the start and above upper to the end, keep the others, then split these at the median
+            # If the median is not between lower and upper (very unlikely), the pass is repeated with the bound on the wrong side removed
+            while True:
+                left = start
+                right = end
+                between = []
+                for block_start in range(start, end, chunk_size):
+                    block = np.sort(order[block_start:min(end,block_start+chunk_size)])
+                    values = vector[block, dim]
+                    below = block[values < lower]
+                    above = block[values > upper]
+                    new_order[left:left+len(below)] = below
+                    new_order[right-len(above):right] = above
+                    left += len(below)
+                    right -= len(above)
+                    inside = (values >= lower) & (values <= upper)
+                    between.append((block[inside], values[inside]))
+                if left-start > half:
+                    lower = -np.inf
+                elif right-start < half:
+                    upper = np.inf
+                else:
+                    break
+            between_neurons = np.concatenate([b for b,v in between])
+            between_values = np.concatenate([v for b,v in between])
+            if 0 < start+half-left < len(between_neurons):
+                between_neurons = between_neurons[np.argpartition(between_values, start+half-left)]
+            new_order[left:right] = between_neurons
+            new_segments += [(start, start+half, order_string+'l'), (start+half, end, order_string+'g')]
+        segments = new_segments
+        order,new_order = new_order,order
+
+    # Bins in the order of median_partition, that is by their split order ('l' before 'g')
+    bins.sort(key=lambda x: x[0].replace('l','0').replace('g','1'))
+    split = [b for o,b in bins]
+    split_order = [o for o,b in bins]
+    if verbose:
+        partition_size = [len(b) for b in split]
+        print('Partitioned into {0} bins, of {1} different sizes ({2} to {3})'.format(
+            len(partition_size),
+            len(np.unique(np.array(partition_size))),
+            min(partition_size),
+            max(partition_size)
+        ))
+    return (split, split_order)
+
+# Returns per-bin minimum, mean and maximum of every column of values (neurons x m), each of shape (bins x m)
+# Bins are laid out one after the other, as in the index order of a kd-tree, and reduced segment by segment
+# With chunk_size, bins are read in groups of at most chunk_size neurons (at least one bin per group)
+# Statistics of empty bins are NaN
+def bin_statistics(partition, values, chunk_size=0):
+    sizes = np.array([len(b) for b in partition])
+    groups = []
+    first = 0
+    total = 0
+    for i,size in enumerate(sizes):
+        if chunk_size > 0 and i > first and total+size > chunk_size:
+            groups.append((first, i))
+            first = i
+            total = 0
+        total += size
+    groups.append((first, len(partition)))
+    statistics = []
+    for first,last in groups:
+        order,offsets,current_sizes = bin_layout(partition[first:last])
+        ordered_values = values[order]
+        statistics.append((
+            reduce_bins(np.minimum, ordered_values, offsets, current_sizes, np.nan),
+            reduce_bins(np.add, ordered_values, offsets, current_sizes, np.nan)/np.maximum(current_sizes, 1)[:,None],
+            reduce_bins(np.maximum, ordered_values, offsets, current_sizes, np.nan)
+        ))
+    return tuple(np.concatenate(current) for current in zip(*statistics))
+
+# State of the sweep workers, set before they are forked: the function creating the partition of a combination, and the shared matrix
+sweep_state = {}
+
+# Attaches a sweep worker to the shared (neurons x candidates) matrix, if there is one
+def sweep_init(shm_name, shape):
+    if shm_name is not None:
+        sweep_state['shm'] = shared_memory.SharedMemory(name=shm_name)
+        sweep_state['matrix'] = np.ndarray(shape, dtype=float, buffer=sweep_state['shm'].buf)
+    np.random.seed()
+
+# Creates the partition of one combination (tuple of indices into sweep_parameters)
+def sweep_worker(combination):
+    return sweep_state['worker'](combination)
+
+# Creates the partitions given by config_dict (the content of a create-bins.config file), and saves them to bin_dir
+# Returns a dictionary from the name of every created partition to the partition (an array of bins, each an array of neurons), and the number of created files
+def create_bins(config_dict, verbose=True):
+    log = print if verbose else (lambda *args, **kwargs: None)
+    created_file_counter = 0
+
+    # Values and boolean flags
+    selection_parameters = config_dict['values']['selection_parameters']    # A list of selection parameters by which to create a kd-tree. Note that the order matters.
+    add_noise = config_dict['values']['add_noise']                          # A boolean list of the same length as above, indicating to which parameters noise should be added. If shorter, assume True.
+    binsize_target = config_dict['values']['binsize_target']                # The target leaf size for the kd-tree. Not guaranteed by default. Will not exceed this if unique values.
+    overwrite_existing = config_dict['values']['overwrite_existing']        # Whether or not to overwrite existing bins (and noise). Default is False.
+    save_centroids = config_dict['values']['save_centroids']                # Wgether or not to save centroids of bins. Default is False.
+    partitioner = config_dict['values'].get('partitioner', 'kdtree')       # Either 'kdtree' (scipy KDTree leaves) or 'median' (exactly 2^n bins of equal size, up to one neuron). Default is kdtree
+    save_statistics = config_dict['values'].get('save_statistics', False)  # Whether or not to save a table of per-bin statistics (count, centroid, bounds, and min/mean/max of statistics_columns). Default is False.
+    statistics_columns = config_dict['values'].get('statistics_columns', [])   # List of further dataframe columns of which to save the per-bin min, mean and max. Only relevant if save_statistics is True
+    chunk_size = config_dict['values'].get('chunk_size', 0)                 # If positive, columns are streamed into a work file in bin_dir and processed in blocks of this many neurons, in bounded memory. Needs partitioner median and a columnar store as dataframe. Default is 0 (all in memory)
+    profile = config_dict['values'].get('profile', False)                   # Whether or not to run under cProfile, saved next to span_file as create-bins-<time>.prof. Default is False
+
+    # Paths of files and folders
+    dataframe = config_dict['paths']['dataframe']                           # Filename of datafrmae in which to look columns with names from selecton_parameters. May also be a columnar store created by convert-parameters.py, then only the used columns are loaded
+    noise_files = config_dict['paths']['noise_files']                       # List of strings (arrays containg noise for each parameter, with corresponding indices). Takes priority over add_noise
+    bin_dir = config_dict['paths']['bin_dir']                               # Directory to which bins will be exported, as a single (ragged) .npy array.
+    span_file = config_dict['paths'].get('span_file', './out-err/spans.jsonl')   # File to which wall and CPU time, peak memory, and bytes and files written of each section are appended, as JSON lines. Default is ./out-err/spans.jsonl
+    catalog = config_dict['paths'].get('catalog', './catalog.sqlite')       # Catalog in which created partitions are recorded, with bin sizes, configuration hash and noise files. Default is ./catalog.sqlite
+
+    # Sweep mode, in which one partition is made for every subset of sweep_size parameters from sweep_parameters
+    sweep = config_dict.get('sweep', {})
+    sweep_parameters = sweep.get('sweep_parameters', [])                    # List of candidate selection parameters. If empty, selection_parameters is used as given and no sweep is done
+    sweep_size = sweep.get('sweep_size', 2)                                 # Number of selection parameters in each combination. Order follows sweep_parameters
+    sweep_add_noise = sweep.get('add_noise', [])                            # A boolean list of the same length as sweep_parameters, as add_noise above. If shorter, assume True
+    num_processes = sweep.get('num_processes', mp.cpu_count())              # Number of processes creating partitions at the same time
+
+    configure(span_file, profile, files=lambda: created_file_counter, stage='create-bins')
+    assert partitioner in ['kdtree', 'median'], 'Partitioner must be one of \'kdtree\', \'median\'.'
+    assert chunk_size == 0 or partitioner == 'median', 'Processing in blocks (chunk_size) needs partitioner \'median\', since the kd-tree is built in memory. Change config file.'
+    assert chunk_size == 0 or is_store(dataframe), 'Processing in blocks (chunk_size) needs a columnar store as dataframe. Create one with convert-parameters.py, or change config file.'
+
+    with open('data/parameters-shortnames.pickle', 'rb') as f:
+        df_shortdict = pickle.load(f)
+
+    # Returns a work file in bin_dir (a memory map, neurons x len(columns)) filled with the given columns of the columnar store, in blocks of chunk_size neurons
+    def work_matrix(name, columns):
+        values = open_memmap(bin_dir+'work_'+name+'.npy', mode='w+', dtype=float, shape=(num_neurons(dataframe), len(columns)))
+        for start in range(0, len(values), chunk_size):
+            load_columns(dataframe, columns, out=values[start:start+chunk_size], rows=slice(start, start+chunk_size))
+        return values
+
+    # Adds noise, normalizes, partitions and saves one combination of selection parameters, each as a span
+    # The matrix vector (neurons x k) is changed in place, statistics (neurons x m) holds the columns from statistics_columns
+    # With chunk_size, both are usually memory maps of a work file, and are read and written in blocks of chunk_size neurons
+    # Returns the partition (an array of bins) and the number of created files
+    def create_partition(vector, selection_parameters, name, noise_files, add_noise, statistics=None, verbose=True):
+        created_file_counter = 0
+        log = print if verbose else (lambda *args, **kwargs: None)
+        nnum = len(vector)
+        blocks = [(start, min(nnum, start+chunk_size)) for start in range(0, nnum, chunk_size)] if chunk_size > 0 else [(0, nnum)]
+
+        # Add and save noise
+        log('Adding noise to selection parameters', flush=True)
+        current_span = start_span('noise', partition=name)
+        used_noise_files = []
+        for i,s in enumerate(selection_parameters):
+            log('Parameter '+str(i+1)+' ('+s+'): ', end='', flush=True)
+            current_parameter = vector[:,i]
+            current_short = df_shortdict[s]
+            current_unique = np.unique(current_parameter)
+            ratio = np.round(len(current_unique)/nnum,3)
+            log('unique to all ratio is '+str(ratio), flush=True)
+
+            # Check if noise file given
+            if i < len(noise_files) and Path(noise_files[i]).is_file():
+                current_noise = np.load(noise_files[i], mmap_mode='r')
+                assert len(current_noise) == nnum, 'Noise file '+noise_files[i]+' has '+str(len(current_noise))+' values, but there are '+str(nnum)+' neurons. Delete noise file or change config file.'
+                for start,end in blocks:
+                    current_parameter[start:end] += current_noise[start:end]
+                used_noise_files.append(noise_files[i])
+                ratio = np.round(len(np.unique(current_parameter))/nnum,3)
+                log('Found existing noise file: using it\nUnique to all ratio is '+str(ratio), flush=True)
+            elif i >= len(add_noise) or add_noise[i]:
+                # Create and save noise, block by block
+                current_min = np.min(np.diff(current_unique))
+                del current_unique
+                if not overwrite_existing:
+                    location = Path(bin_dir+'noise_'+current_short+'_aspartof_'+name+'.npy')
+                    assert not location.is_file(), 'Noise file exists, but config file says to not overwrite. Delete noise file or change config file.'
+                current_noise = open_memmap(bin_dir+'noise_'+current_short+'_aspartof_'+name+'.npy', mode='w+', dtype=float, shape=(nnum,))
+                for start,end in blocks:
+                    current_noise[start:end] = (np.random.rand(end-start)-.5)*current_min
+                    current_parameter[start:end] += current_noise[start:end]
+                current_noise.flush()
+                del current_noise
+                created_file_counter += 1
+
+                # Check unique ratio is 1
+                ratio = np.round(len(np.unique(current_parameter))/nnum,3)
+                log('Noise added: new unique to all ratio is '+str(ratio)+'\nSaved noise', flush=True)
+                used_noise_files.append(bin_dir+'noise_'+current_short+'_aspartof_'+name+'.npy')
+            else:
+                log('No noise added', flush=True)
+                used_noise_files.append(None)
+        end_span(current_span, files_written=created_file_counter)
+
+        # Normalize to unit cube
+        log('Normalizing selection parameters to unit cube', flush=True)
+        current_span = start_span('normalize', partition=name)
+        cur_min = np.min([np.min(vector[start:end], axis=0) for start,end in blocks], axis=0)
+        cur_max = np.max([np.max(vector[start:end], axis=0) for start,end in blocks], axis=0)
+        for start,end in blocks:
+            vector[start:end] -= cur_min
+            vector[start:end] /= cur_max-cur_min
+        end_span(current_span, files_written=0)
+
+        # Create kd-tree
+        current_span = start_span('partition', partition=name, partitioner=partitioner)
+        if partitioner == 'median' and chunk_size > 0:
+            log('----------\nCreating balanced median partition in '+str(len(selection_parameters))+' dimensions, in blocks of '+str(chunk_size)+' neurons', flush=True)
+            partition,split = chunked_median_partition(vector, binsize_target, chunk_size, verbose=verbose)
+        elif partitioner == 'median':
+            log('----------\nCreating balanced median partition in '+str(len(selection_parameters))+' dimensions', flush=True)
+            partition,split = median_partition(vector, binsize_target, verbose=verbose)
+        else:
+            from scipy.spatial import KDTree
+            log('----------\nCreating kd-tree in '+str(len(selection_parameters))+' dimensions', flush=True)
+            tree = KDTree(vector, leafsize=binsize_target)
+            partition,split = return_partition(tree, verbose=verbose, save_split=True)
+        end_span(current_span, files_written=0, num_bins=len(partition))
+
+        # Export partition (array of bins)
+        # Filled element by element, so that bins of equal size are not stacked into a 2D array
+        log('Saving partition', flush=True)
+        current_span = start_span('save', partition=name)
+        noise_file_counter = created_file_counter
+        partition_array = np.empty(len(partition), dtype=object)
+        for i,b in enumerate(partition):
+            partition_array[i] = b
+        if overwrite_existing:
+            np.save(bin_dir+'partition_'+name+'.npy', partition_array)
+        else:
+            location = Path(bin_dir+'partition_'+name+'.npy')
+            assert not location.is_file(), 'Partition file exists, but config file says to not overwrite. Delete partition file or change config file.'
+            np.save(bin_dir+'partition_'+name+'.npy', partition_array)
+        created_file_counter += 1
+        record_partition(catalog, name, bin_dir+'partition_'+name+'.npy', partition_array, nnum,
+            config_hash({'selection_parameters':selection_parameters, 'binsize_target':binsize_target, 'partitioner':partitioner, 'dataframe':dataframe}), used_noise_files)
+
+        # Export split (less / greater order)
+        log('Saving split order', flush=True)
+        if overwrite_existing:
+            np.save(bin_dir+'split_'+name+'.npy', split)
+        else:
+            location = Path(bin_dir+'split_'+name+'.npy')
+            assert not location.is_file(), 'Split file exists, but config file says to not overwrite. Delete split file or change config file.'
+            np.save(bin_dir+'split_'+name+'.npy', split)
+        created_file_counter += 1
+
+        # Compute per-bin bounds of normalized selection parameters, and statistics of further columns
+        if save_centroids or save_statistics:
+            log('Computing bin statistics', flush=True)
+            current_min,current_mean,current_max = bin_statistics(partition, vector, chunk_size)
+            centroids = (current_min+current_max)/2
+            bounds = np.stack((current_min,current_max), axis=1)
+
+        # Export centroids (center of bins) and bounds (bounding box of bins, used when coarsening)
+        if save_centroids:
+            log('Saving centroids', flush=True)
+            for prefix,array in [('centroids_', centroids), ('bounds_', bounds)]:
+                if overwrite_existing:
+                    np.save(bin_dir+prefix+name+'.npy', array)
+                else:
+                    location = Path(bin_dir+prefix+name+'.npy')
+                    assert not location.is_file(), prefix[:-1].capitalize()+' file exists, but config file says to not overwrite. Delete '+prefix[:-1]+' file or change config file.'
+                    np.save(bin_dir+prefix+name+'.npy', array)
+                created_file_counter += 1
+
+        # Export statistics, as one structured array with one row per bin
+        if save_statistics:
+            log('Saving statistics', flush=True)
+            shorts = [df_shortdict[s] for s in selection_parameters]
+            fields = [('count', np.int64)]
+            fields += [(stat+'_'+short, float) for short in shorts for stat in ['centroid','lower','upper']]
+            fields += [(column+'_'+stat, float) for column in statistics_columns for stat in ['min','mean','max']]
+            table = np.zeros(len(partition), dtype=fields)
+            table['count'] = [len(b) for b in partition]
+            for i,short in enumerate(shorts):
+                table['centroid_'+short] = centroids[:,i]
+                table['lower_'+short] = current_min[:,i]
+                table['upper_'+short] = current_max[:,i]
+            if statistics_columns != []:
+                current_min,current_mean,current_max = bin_statistics(partition, statistics, chunk_size)
+                for i,column in enumerate(statistics_columns):
+                    table[column+'_min'] = current_min[:,i]
+                    table[column+'_mean'] = current_mean[:,i]
+                    table[column+'_max'] = current_max[:,i]
+            if overwrite_existing:
+                np.save(bin_dir+'statistics_'+name+'.npy', table)
+            else:
+                location = Path(bin_dir+'statistics_'+name+'.npy')
+                assert not location.is_file(), 'Statistics file exists, but config file says to not overwrite. Delete statistics file or change config file.'
+                np.save(bin_dir+'statistics_'+name+'.npy', table)
+            created_file_counter += 1
+        end_span(current_span, files_written=created_file_counter-noise_file_counter)
+
+        return (partition_array, created_file_counter)
+
+    # Creates the partition of one combination (tuple of indices into sweep_parameters), run by sweep_worker
+    # Returns the name of the partition, the partition and the number of created files
+    def sweep_partition(combination):
+        current_parameters = [sweep_parameters[i] for i in combination]
+        current_name = reduce(lambda x,y: x+'_'+y,[df_shortdict[s] for s in current_parameters])
+        current_add_noise = [i >= len(sweep_add_noise) or sweep_add_noise[i] for i in combination]
+        current_noise_files = [bin_dir+'noise_'+df_shortdict[s]+'_aspartof_'+current_name+'.npy' for s in current_parameters]
+        if chunk_size > 0:
+            values = work_matrix(current_name, current_parameters+(statistics_columns if save_statistics else []))
+            try:
+                current_partition,current_count = create_partition(values[:,:len(combination)], current_parameters, current_name, current_noise_files, current_add_noise, statistics=values[:,len(combination):], verbose=False)
+            finally:
+                del values
+                Path(bin_dir+'work_'+current_name+'.npy').unlink()
+            return (current_name, current_partition, current_count)
+        current_vector = np.array(sweep_state['matrix'][:,list(combination)], dtype=float)
+        current_statistics = sweep_state['matrix'][:,len(sweep_parameters):]
+        return (current_name,)+create_partition(current_vector, current_parameters, current_name, current_noise_files, current_add_noise, statistics=current_statistics, verbose=False)
+
+
+    # Sweep over combinations of selection parameters
+    partitions = {}
+    if sweep_parameters != []:
+        section('sweep')
+        if chunk_size == 0:
+            log('----------\nLoading '+str(len(sweep_parameters))+' candidate selection parameters', flush=True)
+            values = load_columns(dataframe, sweep_parameters+(statistics_columns if save_statistics else []))
+
+        # Skip combinations whose partition already exists
+        todo = []
+        for combination in combinations(range(len(sweep_parameters)), sweep_size):
+            current_name = reduce(lambda x,y: x+'_'+y,[df_shortdict[sweep_parameters[i]] for i in combination])
+            if overwrite_existing or not Path(bin_dir+'partition_'+current_name+'.npy').is_file():
+                todo.append(combination)
+        log('Creating '+str(len(todo))+' partitions with '+str(num_processes)+' processes', flush=True)
+
+        # Place candidate columns and statistics columns in shared memory, read by all workers
+        # With chunk_size, every worker streams its own columns into a work file instead
+        shm = None
+        shape = None
+        try:
+            if chunk_size == 0:
+                shape = values.shape
+                shm = shared_memory.SharedMemory(create=True, size=max(1,int(np.prod(shape))*np.dtype(float).itemsize))
+                np.ndarray(shape, dtype=float, buffer=shm.buf)[:] = values
+                del values
+            # Fork context, so that workers inherit configuration and functions
+            sweep_state['worker'] = sweep_partition
+            with mp.get_context('fork').Pool(num_processes, initializer=sweep_init, initargs=(None if shm is None else shm.name, shape)) as pool:
+                for current_name,current_partition,current_count in pool.imap_unordered(sweep_worker, todo):
+                    log('Created partition '+current_name, flush=True)
+                    partitions[current_name] = current_partition
+                    created_file_counter += current_count
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+    else:
+        # Load selection parameter(s)
+        section('single partition')
+        name = reduce(lambda x,y: x+'_'+y,[df_shortdict[s] for s in selection_parameters])
+        columns = selection_parameters+(statistics_columns if save_statistics else [])
+
+        # One float matrix (neurons x k), noise and normalization are applied to it in place
+        # With chunk_size, it is a memory map of a work file, filled from the columnar store block by block
+        if chunk_size > 0:
+            log('----------\nStreaming selection parameters to '+bin_dir+'work_'+name+'.npy, in blocks of '+str(chunk_size)+' neurons', flush=True)
+            values = work_matrix(name, columns)
+            vector = values[:,:len(selection_parameters)]
+        else:
+            log('----------\nLoading selection parameters', flush=True)
+            values = load_columns(dataframe, columns)
+            vector = np.ascontiguousarray(values[:,:len(selection_parameters)])
+        statistics = values[:,len(selection_parameters):] if save_statistics else None
+        del values
+
+        try:
+            partitions[name],current_count = create_partition(vector, selection_parameters, name, noise_files, add_noise, statistics=statistics, verbose=verbose)
+            created_file_counter += current_count
+        finally:
+            if chunk_size > 0:
+                del vector, statistics
+                Path(bin_dir+'work_'+name+'.npy').unlink()
+
+    end_section()
+    return (partitions, created_file_counter)
@@ -0,0 +1,103 @@
+# Step 2 of 4 (create-parameters.py) as a function: creates the binary 'parameters' of the bins of partitions, for use in the TriDy pipeline
+
+# create_parameters() takes the configuration as a dictionary, in the format of create-parameters.config, and returns the selection matrices
+# Partitions returned by create_bins() can be passed in, then they are not loaded again
+# A selection matrix is given in CSR style, as arrays indptr and indices: the neurons of bin i are indices[indptr[i]:indptr[i+1]]
+
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+from tridy_tools.catalog import record_parameters, partition_info
+from tridy_tools.spans import configure, section, start_span, end_span, end_section
+
+# Creates the parameters of the partitions given by config_dict (the content of a create-parameters.config file), and saves them to parameter_dir
+# partitions is an optional dictionary from names of partitions to partitions, as returned by create_bins(), used instead of the partition files
+# Returns a dictionary from the name of every partition to its selection matrix (a tuple of indptr and indices), and the number of created files
+def create_parameters(config_dict, partitions=None, verbose=True):
+    log = print if verbose else (lambda *args, **kwargs: None)
+    created_file_counter = 0
+
+    # Values
+    selection_parameter_names = config_dict['values']['selection_parameter_names']    # List of names of new 'parameters'. Should be short names, joined by underscore
+    storage_format = config_dict['values'].get('storage_format', 'dense')             # One of 'dense' (one int vector per bin), 'packed' (one bit-packed bins x neurons matrix) or 'index' (CSR-style indptr and indices arrays). Default is dense
+    profile = config_dict['values'].get('profile', False)                             # Whether or not to run under cProfile, saved next to span_file as create-parameters-<time>.prof. Default is False
+
+    # Paths of files and folders
+    bin_dir = config_dict['paths']['bin_dir']                                         # Location of the partition (made of bins) created in step 1. Default is ./bins/
+    parameter_dir = config_dict['paths']['parameter_dir']                             # Where to export the binary parameters. Default is ./parameters/
+    span_file = config_dict['paths'].get('span_file', './out-err/spans.jsonl')        # File to which wall and CPU time, peak memory, and bytes and files written of each section are appended, as JSON lines. Default is ./out-err/spans.jsonl
+    catalog = config_dict['paths'].get('catalog', './catalog.sqlite')                 # Catalog in which the parameter files are recorded. Default is ./catalog.sqlite
+
+    assert storage_format in ['dense', 'packed', 'index'], 'Storage format must be one of \'dense\', \'packed\', \'index\'.'
+    configure(span_file, profile, files=lambda: created_file_counter, stage='create-parameters')
+    partitions = {} if partitions is None else partitions
+
+    # Iterate through selection parameters
+    section('iterate through selection parameters')
+    matrices = {}
+    for sparam in selection_parameter_names:
+        log(sparam, flush=True)
+        current_span = start_span('parameters', partition=sparam, storage_format=storage_format)
+
+        # Load partition file, unless given
+        if sparam in partitions:
+            partition = partitions[sparam]
+        else:
+            log('Loading partition', flush=True)
+            partition = np.load(bin_dir+'partition_'+sparam+'.npy', allow_pickle=True)
+        info = partition_info(catalog, sparam, bin_dir+'partition_'+sparam+'.npy')
+        nnum = info['nnum'] if info is not None else sum(len(b) for b in partition)
+        assert all(len(b) == 0 or np.max(b) < nnum for b in partition), 'Partition '+sparam+' has neurons beyond its number of neurons ('+str(nnum)+'). Check bin_dir in config file.'
+        indptr = np.zeros(len(partition)+1,dtype=np.int64)
+        indptr[1:] = np.cumsum([len(b) for b in partition])
+
+        # Create vectors
+        if storage_format == 'dense':
+            log('Creating binary parameter vectors', flush=True)
+            for i,b in enumerate(partition):
+                current_parameter = np.zeros(nnum,dtype=int)
+                for neuron in b:
+                    current_parameter[neuron] = 1
+                np.save(parameter_dir + sparam + '-' + str(i) + '.npy',current_parameter)
+                created_file_counter += 1
+
+        # Create one bit-packed matrix, one row per bin, written row by row
+        elif storage_format == 'packed':
+            log('Creating packed binary parameter matrix', flush=True)
+            packed = open_memmap(parameter_dir + sparam + '-packed.npy', mode='w+', dtype=np.uint8, shape=(len(partition), (nnum+7)//8))
+            current_parameter = np.zeros(nnum,dtype=bool)
+            for i,b in enumerate(partition):
+                current_parameter[:] = False
+                current_parameter[np.asarray(b,dtype=int)] = True
+                packed[i] = np.packbits(current_parameter)
+            packed.flush()
+            del packed
+            created_file_counter += 1
+
+        # Create CSR-style index arrays, neurons of bin i are indices[indptr[i]:indptr[i+1]], written bin by bin
+        else:
+            log('Creating binary parameter index arrays', flush=True)
+            indices = open_memmap(parameter_dir + sparam + '-indices.npy', mode='w+', dtype=np.int64, shape=(int(indptr[-1]),))
+            for i,b in enumerate(partition):
+                indices[indptr[i]:indptr[i+1]] = np.sort(np.asarray(b,dtype=np.int64))
+            indices.flush()
+            del indices
+            np.save(parameter_dir + sparam + '-indptr.npy', indptr)
+            created_file_counter += 2
+
+        # Save layout, read by create-runfiles.py when patching toolbox.py
+        if storage_format != 'dense':
+            with open(parameter_dir + sparam + '-layout.json', 'w') as f:
+                json.dump({'storage_format':storage_format, 'num_bins':len(partition), 'nnum':nnum}, f)
+            created_file_counter += 1
+        record_parameters(catalog, sparam, storage_format, parameter_dir+sparam, len(partition), nnum)
+
+        # Selection matrix, read through a memory map if just written as index arrays
+        if storage_format == 'index':
+            matrices[sparam] = (indptr, np.load(parameter_dir + sparam + '-indices.npy', mmap_mode='r'))
+        else:
+            matrices[sparam] = (indptr, np.concatenate([np.sort(np.asarray(b,dtype=np.int64)) for b in partition]) if len(partition) > 0 else np.zeros(0,dtype=np.int64))
+        end_span(current_span, num_bins=len(partition))
+
+    end_section()
+    return (matrices, created_file_counter)
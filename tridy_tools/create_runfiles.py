@@ -0,0 +1,615 @@
+# Step 3 of 4 (create-runfiles.py) as a function: creates .sbatch and .json files, and modified pipeline.py and toolbox.py files, for running TriDy
+
+# create_runfiles() takes the configuration as a dictionary, in the format of create-runfiles.config, and returns the bins of every job
+# Partitions returned by create_bins() can be passed in, then they are not loaded again
+# The content of the pipeline.py and toolbox.py files is assumed to be as in the latest version of TriDy
+
+import pickle
+import json
+import os
+from pathlib import Path
+import numpy as np
+from functools import reduce, lru_cache
+from tridy_tools.parameter_store import load_columns
+from tridy_tools.completion import update_completion, featurised_bins, feature_suffix
+from tridy_tools.scheduling import bin_costs, read_runtimes, merge_runtimes, lpt_schedule
+from tridy_tools.resources import read_history, job_requests, format_mem, format_time
+from tridy_tools.feature_store import file_hash, store_key, read_store, harvest, gather
+from tridy_tools.catalog import partition_info, record_partition, record_jobs
+from tridy_tools.spans import configure, section, start_span, end_span, end_section
+
+# Dictionary for translating to pipeline names
+fparam_to_pipename = {"fcc":"ccc"}
+for name in ["ec","tribe_size","deg","in_deg","out_deg","rc","rc_chief","tcc","nbc","dc2","dc3","dc4","dc5","dc6","binary"]:
+    fparam_to_pipename[name] = name
+for spectrum in ["asg","tpsg", "tpsg_reversed", "clsg", "blsg", "blsg_reversed"]:
+    for gap in ["", "_high", "_low", "_radius"]:
+        fparam_to_pipename[spectrum+gap] = spectrum
+
+# Returns the short name of a feature parameter, that of its spectrum if the name ends with a gap (for example asg_low)
+def feature_short(fparam, df_shortdict):
+    try:
+        return df_shortdict[fparam]
+    except:
+        return df_shortdict[reduce(lambda x,y: x+'_'+y,fparam.split('_')[:-1])]
+
+# Returns groups of indices of feature parameters computed by the same jobs, one group per pipeline name if fused, otherwise one per feature parameter
+def group_features(feature_parameters, fuse_features):
+    feature_groups = []
+    for findex,fparam in enumerate(feature_parameters):
+        same_feature = [group for group in feature_groups if fparam_to_pipename[feature_parameters[group[0]]] == fparam_to_pipename[fparam]]
+        if fuse_features and same_feature != []:
+            same_feature[0].append(findex)
+        else:
+            feature_groups.append([findex])
+    return feature_groups
+
+# Function to read files, templates are read only once
+@lru_cache(maxsize=None)
+def read_file(source_file):
+    with open(source_file) as f:
+        return f.read()
+
+# Function to replace strings in a string
+def string_replace(s, old_new_strings):
+    for old_string,new_string in old_new_strings:
+        s = s.replace(old_string, new_string)
+    return s
+
+# Function to replace strings in files, optionally adding a prefix
+# Modified from https://stackoverflow.com/questions/4128144
+def file_string_replace(source_file, target_file, old_new_strings, verbose=False, prefix=''):
+
+    # Read the (cached) input file
+    s = read_file(source_file)
+    if verbose:
+        for old_string,new_string in old_new_strings:
+            if old_string not in s:
+                print('"{old_string}" not found in {source_file}, exiting.'.format(**locals()))
+                return
+
+    # Safely write the changed content, if found in the file
+    with open(target_file, 'w') as f:
+        # print('Changing "{old_string}" to "{new_string}" in {filename}'.format(**locals()))
+        f.write(prefix+string_replace(s, old_new_strings))
+
+# Code placed at the start of pipeline.py for job arrays
+# If started with a manifest, writes the configuration of the current array task to a local temporary file and uses that instead
+array_prelude = '''# Job array: configuration of this task is taken from the manifest, through a temporary file removed at exit
+import os as array_os, sys as array_sys, json as array_json, tempfile as array_tempfile, atexit as array_atexit
+if len(array_sys.argv) > 1 and array_sys.argv[1].endswith('manifest.json'):
+    with open(array_sys.argv[1], 'r') as array_f:
+        array_manifest = array_json.load(array_f)
+    array_task = array_os.environ['SLURM_ARRAY_TASK_ID']
+    array_manifest['config']['values']['job_order'] = int(array_task)
+    array_manifest['config']['values']['selection_parameters'] = array_manifest['tasks'][array_task]
+    with array_tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as array_f:
+        array_json.dump(array_manifest['config'], array_f)
+    array_sys.argv[1] = array_f.name
+    array_atexit.register(array_os.remove, array_f.name)
+
+'''
+
+# Code placed at the start of pipeline.py for result records
+# The output file of the classification results is replaced by one that also writes a JSON line for every bin, when its line starting with 'cv' is written
+# Lines that cannot be read are recorded with an error, so that collect-results.py falls back to the text file instead of silently missing results
+record_prelude = r'''# Result records: classification results are also written as JSON lines
+import json as record_json, re as record_re, time as record_time
+class RecordedOutput:
+    def __init__(self, text_file, record_file):
+        self.folder = str(text_file).split('/')[-2] if '/' in str(text_file) else None
+        self.text = open(text_file, 'w')
+        self.records = open(record_file, 'w')
+        self.pending = ''
+        self.previous_line = ''
+        self.last_time = record_time.time()
+    def record(self, line):
+        if line[:2].lower() == 'cv':
+            now = record_time.time()
+            current_record = {'bin':self.previous_line.strip(), 'seconds':now-self.last_time, 'time':now}
+            numbers = [float(n) for n in record_re.findall(r'\d+\.?\d*|\.\d+', line)]
+            try:
+                current_record['bin_number'] = int(self.previous_line.split('-')[-1])
+                for k,column in enumerate(['cv_acc', 'cv_err', 'test_acc', 'test_err']):
+                    current_record[column] = numbers[k]
+                current_record['nonzero_count'] = int(numbers[4])
+                current_record['total_count'] = int(numbers[5])
+            except (ValueError, IndexError) as error:
+                current_record['error'] = repr(error)
+                current_record['line'] = line
+            self.records.write(record_json.dumps(current_record)+'\n')
+            self.records.flush()
+            if 'span_mark' in globals():
+                span_mark('classify', bin=current_record['bin'], folder=self.folder)
+            self.last_time = now
+        self.previous_line = line
+    def write(self, s):
+        self.text.write(s)
+        lines = (self.pending+s).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self.record(line)
+        return len(s)
+    def flush(self):
+        self.text.flush()
+        self.records.flush()
+    def close(self):
+        if self.pending != '':
+            self.record(self.pending)
+            self.pending = ''
+        self.text.close()
+        self.records.close()
+    def __getattr__(self, name):
+        return getattr(self.text, name)
+
+'''
+
+# Code placed at the start of pipeline.py for spans, the same records as those of tridy_tools/spans.py
+# TriDy does not mark its steps, so a featurisation span of a bin ends when its feature vector is saved (numpy.save is wrapped),
+# and a classification span when its result line is written (only with write_records), each starting at the end of the previous span
+span_prelude = '''# Spans: time and memory of this job and of every bin are written to standard error, as lines starting with 'SPAN '
+# numpy.save is wrapped once per process, so that runs of this file by fused-<sparam>.py share one span_state and one job span
+import sys as span_sys, json as span_json, time as span_time, atexit as span_atexit, resource as span_resource, numpy as span_np
+if not hasattr(span_np.save, 'span_wrapped'):
+    span_state = {'start':span_time.time(), 'last':span_time.time(), 'cpu':span_time.process_time()}
+    def span_mark(name, **attributes):
+        now = span_time.time()
+        cpu = span_time.process_time()
+        record = {'stage':'pipeline', 'span':name, 'parent':'job', 'start':span_state['last'], 'wall':now-span_state['last'], 'cpu':cpu-span_state['cpu'],
+            'max_rss_mb':span_resource.getrusage(span_resource.RUSAGE_SELF).ru_maxrss/1024, 'argv':span_sys.argv[1:]}
+        record.update(attributes)
+        span_sys.stderr.write('SPAN '+span_json.dumps(record)+'\\n')
+        span_sys.stderr.flush()
+        span_state['last'] = now
+        span_state['cpu'] = cpu
+    def span_save(file, *args, **kwargs):
+        span_np_save(file, *args, **kwargs)
+        if str(file).endswith('_feature_vectors.npy'):
+            span_mark('featurise', bin=str(file).split('/')[-1][:-len('_feature_vectors.npy')], folder=str(file).split('/')[-2] if '/' in str(file) else None)
+    def span_job():
+        span_state['last'] = span_state['start']
+        span_state['cpu'] = 0
+        span_mark('job', parent=None)
+    span_save.span_wrapped = True
+    span_save.span_mark = span_mark
+    span_np_save = span_np.save
+    span_np.save = span_save
+    span_atexit.register(span_job)
+span_mark = span_np.save.span_mark
+'''
+
+# Creates the job files of the selection and feature parameters given by config_dict (the content of a create-runfiles.config file)
+# partitions is an optional dictionary from names of partitions to partitions, as returned by create_bins(), used instead of the partition files
+# Returns a dictionary from the name of every job collection (<sparam>-<fshort>) to its list of jobs (the bins of every job), and the numbers of created files and directories
+def create_runfiles(config_dict, partitions=None, verbose=True):
+    log = print if verbose else (lambda *args, **kwargs: None)
+    partitions = {} if partitions is None else partitions
+
+    # Values and boolean flags
+    selection_parameters = config_dict['values']['selection_parameters']        # List of selection parameters to use. Should match names of custom selection parameter binary arrays
+    feature_parameters = config_dict['values']['feature_parameters']            # List of feature parameters to use. One collection of files will be created for each
+    num_jobs = config_dict['values']['num_jobs']                                # List of number of jobs (=number of sbatch files) to split up featursation+classification task into. Same length as feature_parameters
+    randomise_vectors = config_dict['values']['randomise_vectors']              # If true, will randomise the assignment of tasks to each job. Useful if computation-intensive neighbourhoods are not evenly distributed
+    check_featurevectors = config_dict['values']['check_featurevectors']        # Check to see if some parameters have already been featurised. Default is False
+    check_dataframes = config_dict['values']['check_dataframes']                # Check to see if some parameters have already been classified. Default is False
+    only_featurise = config_dict['values']['only_featurise']                    # If true, only creates the feature vectors and does not classify. Useful when repeating long jobs.
+    fuse_features = config_dict['values'].get('fuse_features', False)           # If true, feature parameters from the same spectrum (or other pipeline feature) are computed in the same jobs, sharing loaded data, neighbourhoods and spectra. Number of jobs of the first one is used. Default is False
+    job_array = config_dict['values'].get('job_array', False)                   # If true, creates one Slurm job array (one .sbatch file and one manifest.json) per selection and feature parameter, instead of one .sbatch and .json file per job. Default is False
+    packing = config_dict['values'].get('packing', 'even')                      # Either 'even' (same number of bins per job) or 'lpt' (bins assigned by estimated cost, longest first). Default is even
+    cost_column = config_dict['values'].get('cost_column', 'tribe_size')        # Dataframe column from which the cost of a neuron is estimated. Only relevant if packing is lpt
+    cost_exponent = config_dict['values'].get('cost_exponent', 3)               # Cost of a neuron is cost_column to this power. Cost of a bin is the sum over its neurons, or the measured runtime in results/<sparam>-<fshort>/runtimes.json if known
+    feature_cost_exponents = config_dict['values'].get('feature_cost_exponents', {})  # Dictionary from pipeline feature names (for example "asg", "tcc") to their cost exponent, for features whose cost grows differently. Others use cost_exponent. Default is {}
+    right_size = config_dict['values'].get('right_size', False)                 # If true, memory and time of each job are estimated from the cost of its bins and earlier jobs of the same feature in outerr_dir. Otherwise (or without earlier jobs) max_mem_gb and max_time_hours are used. Default is False
+    safety_factor = config_dict['values'].get('safety_factor', 1.5)             # Estimated memory and time are multiplied by this. Only relevant if right_size is True. Default is 1.5
+    min_mem_gb = config_dict['values'].get('min_mem_gb', 8)                     # Smallest memory to request per job, in GB. Default is 8
+    max_mem_gb = config_dict['values'].get('max_mem_gb', 256)                   # Largest memory to request per job, in GB. Default is 256
+    min_time_hours = config_dict['values'].get('min_time_hours', 0.5)           # Smallest time to request per job, in hours. Default is 0.5
+    max_time_hours = config_dict['values'].get('max_time_hours', 24)            # Largest time to request per job, in hours. Default is 24
+    write_records = config_dict['values'].get('write_records', True)            # If true, the modified pipeline.py also writes the classification result of every bin as a JSON line to classification_records_<fparam>_<job>.jsonl, read by collect-results.py. Default is True
+    feature_store = config_dict['values'].get('feature_store', False)           # If true, feature vectors in results/ of all partitions are added to a per-neuron store, and feature vectors of bins whose neurons are all stored are assembled from it, leaving only classification. Default is False
+    pipeline_spans = config_dict['values'].get('pipeline_spans', True)          # If true, the modified pipeline.py writes the time and memory of the job, and of featurisation and classification of every bin, to standard error (the .err file) as lines starting with 'SPAN '. Default is True
+    profile = config_dict['values'].get('profile', False)                       # Whether or not to run under cProfile, saved next to span_file as create-runfiles-<time>.prof. Default is False
+
+    # Paths of files and folders
+    json_template = config_dict['paths']['json_template']                       # Template to use when creating configuration .json files
+    sbatch_template = config_dict['paths']['sbatch_template']                   # Template to use when creating .sbatch files to begin jobs
+    fused_template = config_dict['paths'].get('fused_template', './templates/fused.py')   # Template to use when creating the fused-<sparam>.py files. Only relevant if fuse_features is True. Default is ./templates/fused.py
+    tridy_dir = config_dict['paths']['tridy_dir']                               # Location of TriDy package as it is on github. Default is ./../TriDy/
+    bin_dir = config_dict['paths']['bin_dir']                                   # Location of bins (selection paramater partition). Necessary to know indices of jobs. Default is ./bins/
+    parameter_dir = config_dict['paths']['parameter_dir']                       # Location of parameters created in step 2. Default is ./parameters/
+    config_dir = config_dict['paths']['config_dir']                             # Where to export the configuration .json files. Default is ./configs/
+    sbatch_dir = config_dict['paths']['sbatch_dir']                             # Where to export the .sbatch batch files. Default is ./sbatches/
+    runfile_dir = config_dict['paths']['runfile_dir']                           # Where to export the runfiles. Default is ./runfiles/
+    results_dir = config_dict['paths']['results_dir']                           # Where the classification results are located. Default is ./results/
+    dataframe_dir = config_dict['paths']['dataframe_dir']                       # Where dataframes will be exported. Relevant only if check_dataframes = True. Default is ./dataframes/
+    dataframe = config_dict['paths'].get('dataframe', './data/parameters.pkl')  # Dataframe (or columnar store) of neuron parameters, for cost estimates. Only relevant if packing is lpt or right_size is True. Default is ./data/parameters.pkl
+    feature_store_dir = config_dict['paths'].get('feature_store_dir', './feature-store/')   # Location of the per-neuron feature store. Only relevant if feature_store is True. Default is ./feature-store/
+    span_file = config_dict['paths'].get('span_file', './out-err/spans.jsonl')  # File to which wall and CPU time, peak memory, and bytes and files written of each section are appended, as JSON lines. Default is ./out-err/spans.jsonl
+    catalog = config_dict['paths'].get('catalog', './catalog.sqlite')           # Catalog of partitions, from which numbers of bins are read, and in which the generated jobs are recorded. Default is ./catalog.sqlite
+    outerr_dir = config_dict['paths'].get('outerr_dir', './out-err/')           # Where output and errors of earlier jobs are, including the local-*.json summaries of run-local.py. Only relevant if right_size is True. Default is ./out-err/
+
+    assert packing in ['even', 'lpt'], 'Packing must be one of \'even\', \'lpt\'.'
+    assert len(feature_parameters)==len(num_jobs), 'Number of feature parameters ('+str(len(feature_parameters))+') does not match number of job splits ('+str(len(num_jobs))+')'
+
+    # Get feature gaps from names
+    feature_gaps = []
+    for p in feature_parameters:
+        if (p == "asg") or (p == "asg_high"):
+            feature_gaps.append("high")
+        elif (p == "tpsg") or (p == "tpsg_high"):
+            feature_gaps.append("high")
+        elif (p == "tpsg_reversed") or (p == "tpsg_reversed_high"):
+            feature_gaps.append("high")
+        elif (p == "clsg") or (p == "clsg_low"):
+            feature_gaps.append("low")
+        elif (p == "blsg") or (p == "blsg_high"):
+            feature_gaps.append("high")
+        elif (p == "blsg_reversed") or (p == "blsg_reversed_high"):
+            feature_gaps.append("high")
+        elif "high" in p:
+            feature_gaps.append("high")
+        elif "low" in p:
+            feature_gaps.append("low")
+        elif "radius" in p:
+            feature_gaps.append("radius")
+        else:
+            feature_gaps.append("")
+
+    created_file_counter = 0
+    created_directory_counter = 0
+    configure(span_file, profile, files=lambda: created_file_counter, stage='create-runfiles')
+
+    # Load parameter shortname dictionary
+    section('load parameter shortname dictionary')
+    log('Loading parameter names', flush=True)
+    with open('data/parameters-shortnames.pickle', 'rb') as f:
+        df_shortdict = pickle.load(f)
+
+    # Short names of feature parameters, and groups of them computed by the same jobs
+    feature_shorts = [feature_short(fparam, df_shortdict) for fparam in feature_parameters]
+    for fgap in feature_gaps:
+        assert fgap in ['', 'high','low','radius'], 'Feature gap must be one of \'\', \'high\', \'low\', \'radius\'.'
+    feature_groups = group_features(feature_parameters, fuse_features)
+
+    # Estimated cost of every neuron, before taking the power of the feature
+    if packing == 'lpt' or right_size:
+        log('Loading neuron costs', flush=True)
+        cost_values = load_columns(dataframe, [cost_column])[:,0]
+
+    # Memory and time used by earlier jobs
+    history = []
+    if right_size:
+        history = read_history(outerr_dir, config_dir)
+        log('Found '+str(len(history))+' earlier jobs with measured memory and time', flush=True)
+
+    # Returns the bins (partition) of a selection parameter, given or from its file, None if they are not found
+    @lru_cache(maxsize=None)
+    def load_partition(sparam):
+        if sparam in partitions:
+            return partitions[sparam]
+        expected_bins = Path(bin_dir+'partition_'+sparam+'.npy')
+        if not expected_bins.is_file():
+            return None
+        return np.load(expected_bins,allow_pickle=True)
+
+    # Returns the estimated cost of every bin of a selection parameter, for a cost exponent. None if its bins are not found
+    @lru_cache(maxsize=None)
+    def partition_costs(sparam, exponent):
+        if load_partition(sparam) is None:
+            return None
+        return bin_costs(load_partition(sparam), cost_values**exponent)
+
+    # Returns (estimated cost, seconds, peak memory in MB) of earlier jobs of a job collection <fshort>, for any selection parameter
+    def feature_history(fshort, exponent):
+        feature_jobs = []
+        for record in history:
+            record_sparam,record_fshort = record['name'].split('-', 1)
+            costs = partition_costs(record_sparam, exponent)
+            if record_fshort == fshort and costs is not None:
+                bins = [int(b.split('-')[-1]) for b in record['bins'] if int(b.split('-')[-1]) < len(costs)]
+                feature_jobs.append((float(np.sum(costs[bins])), record['seconds'], record['max_rss_mb']))
+        return feature_jobs
+
+    # Adds feature vectors of the features of a group in results/, of any partition, to the feature store
+    # Then saves feature vectors of the given bins of sparam whose neurons are all in the store, for every feature of the group
+    # Returns the bins that have feature vectors of every feature of the group (assembled or already there)
+    def assemble_from_store(sparam, group, bins):
+        completion = update_completion(results_dir)
+        partition = load_partition(sparam)
+        complete = [b for b in bins if len(partition[b]) <= number_nbhds]
+        member_vectors = []
+        for k in group:
+            key = store_key(fparam_to_pipename[feature_parameters[k]], feature_gaps[k], matrix_hash)
+            harvest_bins = []
+            for name in sorted(completion):
+                name_sparam,_,name_fshort = name.partition('-')
+                name_bins = sorted(featurised_bins(completion, name, name_sparam))
+                if name_fshort == feature_shorts[k] and name_bins != [] and load_partition(name_sparam) is not None:
+                    harvest_bins.append((Path(results_dir, name), name_sparam, load_partition(name_sparam), name_bins))
+            log(feature_shorts[k]+': '+str(harvest(feature_store_dir, key, harvest_bins, number_nbhds))+' neurons added to the feature store', flush=True)
+
+            # Keep bins that already have feature vectors, or whose neurons are all in the store
+            neurons,values = read_store(feature_store_dir, key)
+            done = featurised_bins(completion, sparam+'-'+feature_shorts[k], sparam)
+            vectors = {}
+            for b in complete:
+                if b not in done:
+                    vectors[b] = gather(neurons, values, partition[b])
+            complete = [b for b in complete if b in done or vectors[b] is not None]
+            member_vectors.append(vectors)
+
+        for k,vectors in zip(group, member_vectors):
+            for b in complete:
+                if b in vectors:
+                    np.save(results_dir+sparam+'-'+feature_shorts[k]+'/'+sparam+'-'+str(b)+feature_suffix, vectors[b])
+        return complete
+
+    # Number of neighbourhoods per bin and connectivity matrix of the jobs, which determine which feature vectors can be stored
+    if feature_store:
+        template_config = json.loads(string_replace(read_file(json_template), [('#JOBNUM','0')]))
+        number_nbhds = template_config['values']['number_nbhds']
+        matrix_hash = file_hash(template_config['paths']['matrix_address'])
+
+        # Only bins of at most number_nbhds neurons are stored or assembled, since TriDy selects number_nbhds neighbourhoods of larger bins
+        # Rows of their feature vectors are taken to be the neurons in increasing order, which is not checked against TriDy
+        bin_sizes = [len(b) for sparam in selection_parameters if load_partition(sparam) is not None for b in load_partition(sparam)]
+        storable = sum(0 < size <= number_nbhds for size in bin_sizes)
+        if storable == 0:
+            log('Warning: no bin has at most number_nbhds ('+str(number_nbhds)+') neurons, not using the feature store. Lower binsize_target, or raise number_nbhds in json_template', flush=True)
+            feature_store = False
+        else:
+            log('Warning: the feature store takes rows of feature vectors to be the neurons of a bin in increasing order. Check this against the TriDy version used', flush=True)
+            if storable < len(bin_sizes):
+                log('Warning: only '+str(storable)+' of '+str(len(bin_sizes))+' bins have at most number_nbhds ('+str(number_nbhds)+') neurons, only these use the feature store', flush=True)
+
+    # Create folders and runfiles
+    section('create folders and runfiles')
+    jobs = {}
+    for sparam in selection_parameters:
+
+        # Number of bins, from the catalog, or from the bins (partition) if these are not recorded or changed since
+        expected_bins = bin_dir+'partition_'+sparam+'.npy'
+        info = partition_info(catalog, sparam, expected_bins)
+        if sparam in partitions:
+            num_bins = len(partitions[sparam])
+        elif info is not None:
+            num_bins = info['num_bins']
+        elif load_partition(sparam) is not None:
+            num_bins = len(load_partition(sparam))
+            record_partition(catalog, sparam, expected_bins, load_partition(sparam), sum(len(b) for b in load_partition(sparam)))
+        else:
+            assert False, 'Expected bin file '+expected_bins+' not found. Check bin_dir in config file.'
+        log('Selection parameter '+sparam+' has '+str(num_bins)+' bins', flush=True)
+
+        # Iterate over (groups of) feature parameters
+        # A fused group is named by the short names of its features joined by '+', results are saved per feature
+        for group in feature_groups:
+            findex = group[0]
+            fparam = feature_parameters[findex]
+            fshort = reduce(lambda x,y: x+'+'+y, [feature_shorts[k] for k in group])
+            fgap = feature_gaps[findex]
+            current_name = sparam+'-'+fshort
+            member_names = [sparam+'-'+feature_shorts[k] for k in group]
+            exponent = feature_cost_exponents.get(fparam_to_pipename[fparam], cost_exponent)
+            log(current_name, flush=True)
+            current_span = start_span('collection', collection=current_name)
+            current_num_jobs = 0
+
+            # Create folders
+            for parent_dir,names in [(config_dir,[current_name]), (sbatch_dir,[current_name]), (results_dir,member_names)]:
+                for name in names:
+                    try:
+                        os.mkdir(parent_dir+'/'+name)
+                        created_directory_counter += 1
+                    except:
+                        pass
+
+            # Create list of vectors to featurise
+            missing_vectors = []
+            skip_current = False
+            if check_dataframes:
+                log('Searching for results dataframe. ', end='', flush=True)
+                if not all(Path(dataframe_dir+name+'.pkl').is_file() for name in member_names):
+                    log('Not found.', flush=True)
+                else:
+                    log('Found.', flush=True)
+                    skip_current = True
+
+            if check_featurevectors:
+                log('Searching for vectors not yet featurised. ', end='', flush=True)
+                completion = update_completion(results_dir, member_names)
+                featurised = set.intersection(*[featurised_bins(completion, name, sparam) for name in member_names])
+                missing_vectors = [i for i in range(num_bins) if i not in featurised]
+                if missing_vectors == []:
+                    skip_current = True
+
+            if (not check_dataframes) and (not check_featurevectors):
+                missing_vectors = list(range(num_bins))
+
+            # Without bins or jobs, no requests, .sbatch files or job array can be made
+            if not skip_current and (len(missing_vectors) == 0 or num_jobs[findex] == 0):
+                log('No bins to featurise or no jobs requested', flush=True)
+                skip_current = True
+
+            if not skip_current:
+                num_bins_real = len(missing_vectors)
+                log('Vector count: '+str(num_bins_real), flush=True)
+
+                # Bins with feature vectors only need classification, so their cost is taken as 0
+                assembled = []
+                if feature_store:
+                    assembled = assemble_from_store(sparam, group, missing_vectors)
+                    log('Feature vectors available for '+str(len(assembled))+' bins, the others are featurised', flush=True)
+                if packing == 'lpt' or right_size:
+                    current_costs = partition_costs(sparam, exponent).copy()
+                    current_costs[np.array(assembled,dtype=int)] = 0
+
+                # Distribute jobs by estimated cost, longest processing time first
+                current_num_jobs = num_jobs[findex]
+                if packing == 'lpt':
+                    current_runtimes = sum(read_runtimes(results_dir+name+'/runtimes.json', sparam, num_bins) for name in member_names)
+                    log('Measured runtimes known for '+str(np.sum(~np.isnan(current_runtimes)))+' bins', flush=True)
+                    costs = merge_runtimes(current_costs, current_runtimes)
+                    costs[np.array(assembled,dtype=int)] = 0
+                    job_list,job_costs = lpt_schedule(list(missing_vectors), costs[np.array(missing_vectors,dtype=int)], current_num_jobs)
+                    if job_costs != []:
+                        log('Largest to mean estimated job cost is '+str(np.round(max(job_costs)/np.mean(job_costs),3)), flush=True)
+
+                # Distribute jobs evenly
+                else:
+                    chunk_size = num_bins_real//current_num_jobs
+                    chunks = [chunk_size]*current_num_jobs
+                    leftover_size = num_bins_real%current_num_jobs
+                    for i in range(leftover_size):
+                        chunks[i]+=1
+                    assert sum(chunks) == num_bins_real, 'Number of expected bins ('+str(num_bins_real)+') does not match sum of job sizes ('+str(sum(chunks))+')'
+                    chunks_sum = [sum(chunks[:k]) for k in range(len(chunks)+1)]
+
+                    # Convert to numpy array and randomly rearrange
+                    if randomise_vectors:
+                        missing_vectors = np.array(missing_vectors)
+                        np.random.shuffle(missing_vectors)
+
+                    # Split into list of lists, one sublist of indices for each job
+                    job_list = [missing_vectors[chunks_sum[job_num]:chunks_sum[job_num+1]] for job_num in range(current_num_jobs)]
+
+                # Inform user of status
+                if num_bins_real < current_num_jobs:
+                    job_list = job_list[:num_bins_real]
+                    current_num_jobs = num_bins_real
+                log('Splitting into '+str(current_num_jobs)+' jobs', flush=True)
+                record_jobs(catalog, current_name, sparam, fshort, job_list)
+                jobs[current_name] = [[int(i) for i in job] for job in job_list]
+
+                # Memory and time to request for each job
+                if right_size:
+                    feature_jobs = feature_history(fshort, exponent)
+                    requests = job_requests([float(np.sum(current_costs[np.array(job_list[job_num],dtype=int)])) for job_num in range(current_num_jobs)],
+                        feature_jobs, safety_factor, min_mem_gb, max_mem_gb, min_time_hours, max_time_hours)
+                    if requests != []:
+                        log('Requesting up to '+format_mem(max(r[0] for r in requests))+' and '+format_time(max(r[1] for r in requests))+' per job, estimated from '+str(len(feature_jobs))+' earlier jobs', flush=True)
+                else:
+                    requests = [(max_mem_gb, max_time_hours*3600)]*current_num_jobs
+
+                # Generate .sh file for easy execution of sbatch files
+                f = open(runfile_dir+current_name+'.sh','w')
+                string_replacements = [('#SSHORT',sparam), ('#FPARAM',fparam_to_pipename[fparam]), ('#FSHORT',fshort), ('#FGAP',fgap)]
+
+                # Fused jobs run fused-<sparam>.py, with the feature parameter, gap and results folder of every feature
+                fused = []
+                if len(group) > 1:
+                    string_replacements.append(('runfiles/pipeline-', 'runfiles/fused-'))
+                    for k in group:
+                        member_config = json.loads(string_replace(read_file(json_template), [('#SSHORT',sparam), ('#FPARAM',fparam_to_pipename[feature_parameters[k]]), ('#FSHORT',feature_shorts[k]), ('#FGAP',feature_gaps[k]), ('#JOBNUM','0'), ('#SPARAMS','')]))
+                        fused.append({'feature_parameter':member_config['values']['feature_parameter'], 'feature_gap':member_config['values']['feature_gap'], 'savefolder':member_config['paths']['savefolder']})
+
+                # Create one manifest, mapping array task IDs to bins, and one .sbatch file for the whole array
+                if job_array:
+                    manifest = {
+                        'config': json.loads(string_replace(read_file(json_template), string_replacements+[('#JOBNUM','0'), ('#SPARAMS','')])),
+                        'tasks': {str(job_num):[sparam+'-'+str(i) for i in job_list[job_num]] for job_num in range(current_num_jobs)}
+                    }
+                    if fused != []:
+                        manifest['config']['values']['fused'] = fused
+                    with open(config_dir+current_name+'/manifest.json','w') as manifest_file:
+                        json.dump(manifest, manifest_file, indent=1)
+                    created_file_counter += 1
+
+                    array_replacements = string_replacements+[('#MEM',format_mem(max(r[0] for r in requests))), ('#TIME',format_time(max(r[1] for r in requests)))]+[('#!/bin/bash\n','#!/bin/bash\n#SBATCH --array=0-'+str(current_num_jobs-1)+'\n'), ('#JOBNUM.json','manifest.json'), ('-#JOBNUM.','-%a.'), ('-#JOBNUM',''), ('#JOBNUM','%a')]
+                    file_string_replace(sbatch_template, sbatch_dir+current_name+'/array.sbatch', array_replacements)
+                    created_file_counter += 1
+                    f.write('sbatch ..'+sbatch_dir[1:]+current_name+'/array.sbatch\n')
+
+                else:
+                    for job_num in range(current_num_jobs):
+                        # Declare string replacements
+                        job_replacements = string_replacements+[('#JOBNUM',str(job_num)), ('#MEM',format_mem(requests[job_num][0])), ('#TIME',format_time(requests[job_num][1]))]
+                        job_replacements.append(('#SPARAMS',reduce(lambda x,y: x+'\", \"'+y, [sparam+'-'+str(i) for i in job_list[job_num]])))
+
+                        # Create .json files
+                        if fused != []:
+                            job_config = json.loads(string_replace(read_file(json_template), job_replacements))
+                            job_config['values']['fused'] = fused
+                            with open(config_dir+current_name+'/'+str(job_num)+'.json','w') as job_file:
+                                json.dump(job_config, job_file, indent=2)
+                        else:
+                            file_string_replace(json_template, config_dir+current_name+'/'+str(job_num)+'.json', job_replacements)
+                        created_file_counter += 1
+
+                        # Create .sbatch files
+                        file_string_replace(sbatch_template, sbatch_dir+current_name+'/'+str(job_num)+'.sbatch', job_replacements)
+                        created_file_counter += 1
+
+                        # Write line to .sh file
+                        f.write('sbatch ..'+sbatch_dir[1:]+current_name+'/'+str(job_num)+'.sbatch\n')
+
+                # Close .sh file
+                f.close()
+                created_file_counter += 1
+
+            else:
+                log('Nothing to do, skipping', flush=True)
+            end_span(current_span, num_jobs=current_num_jobs)
+
+        log('Creating modified toolbox.py and pipeline.py files', flush=True)
+        # Copy and modify toolbox.py file
+        toolbox_replacements = [(
+            # Custom selection parameter names in dictionary
+            'param_dict_inverse = {',
+            'for i in range('+str(num_bins)+'):\n    param_dict[\''+sparam+'-\'+str(i)]=\''+sparam+'-\'+str(i)\n\nparam_dict_inverse = {'
+            ),(
+            # Load custom selection parameters
+            'param_files = [np.load(dir_export+\'individual_parameters/\'+param_dict_inverse[f]+\'.npy\',allow_pickle=True) for f in param_names]\n',
+            'param_files = []\nfor f in param_names:\n    try:\n        param_files.append(np.load(dir_export+\'individual_parameters/\'+param_dict_inverse[f]+\'.npy\',allow_pickle=True))\n    except:\n        param_files.append(np.load(\'./../TriDy-tools'+parameter_dir[1:]+'\'+param_dict_inverse[f]+\'.npy\',allow_pickle=True))\n'
+            )]
+
+        # Read parameters of this partition from a single packed or index file, one row through a memory map
+        layout_file = Path(parameter_dir+sparam+'-layout.json')
+        if layout_file.is_file():
+            with open(layout_file, 'r') as f:
+                layout = json.load(f)
+            layout_path = './../TriDy-tools'+parameter_dir[1:]+sparam
+            if layout['storage_format'] == 'packed':
+                load_custom = '        param_files.append(np.unpackbits(np.load(\''+layout_path+'-packed.npy\',mmap_mode=\'r\')[int(param_dict_inverse[f].split(\'-\')[-1])],count='+str(layout['nnum'])+').astype(int))\n'
+            else:
+                load_custom = ('        param_row = int(param_dict_inverse[f].split(\'-\')[-1])\n'
+                    '        param_indptr = np.load(\''+layout_path+'-indptr.npy\',mmap_mode=\'r\')\n'
+                    '        param_vector = np.zeros('+str(layout['nnum'])+',dtype=int)\n'
+                    '        param_vector[np.load(\''+layout_path+'-indices.npy\',mmap_mode=\'r\')[param_indptr[param_row]:param_indptr[param_row+1]]] = 1\n'
+                    '        param_files.append(param_vector)\n')
+            toolbox_replacements[1] = (toolbox_replacements[1][0], toolbox_replacements[1][1].split('    except:\n')[0]+'    except:\n'+load_custom)
+
+        file_string_replace(tridy_dir+'toolbox.py', runfile_dir+'toolbox-'+sparam+'.py', toolbox_replacements)
+        created_file_counter += 1
+
+        # Copy and modify pipeline.py file
+        pipeline_replacements = [(
+            # Open modified toolbox file
+            'exec(open(\'toolbox.py\').read())',
+            'exec(open(\'../TriDy-tools'+runfile_dir[1:]+'toolbox-'+sparam+'.py\').read())'
+            ),(
+            # Declare job number
+            '\'bin_number\']\n',
+            '\'bin_number\']\njob_order = config_dict[\'values\'][\'job_order\']\n'
+            ),(
+            # Insert job number into output file
+            'output = open(savefolder + \'classification_accuracies_\'+feature_parameter+\'.txt\',\'w\')',
+            'output = open(savefolder + \'classification_accuracies_\'+feature_parameter+\'_\'+str(job_order)+\'.txt\',\'w\')'
+            )]
+        # Write result records next to the text file
+        if write_records:
+            pipeline_replacements[2] = (pipeline_replacements[2][0], 'output = RecordedOutput(savefolder + \'classification_accuracies_\'+feature_parameter+\'_\'+str(job_order)+\'.txt\', savefolder + \'classification_records_\'+feature_parameter+\'_\'+str(job_order)+\'.jsonl\')')
+        # Remove classification step
+        if only_featurise:
+            pipeline_replacements.append(('classify()\n','# classify()\n'))
+
+        file_string_replace(tridy_dir+'pipeline.py', runfile_dir+'pipeline-'+sparam+'.py', pipeline_replacements, prefix=(span_prelude if pipeline_spans else '')+(record_prelude if write_records else '')+(array_prelude if job_array else ''))
+        created_file_counter += 1
+
+        # Create fused-<sparam>.py file, running the modified pipeline.py once per feature of a fused job
+        if any(len(group) > 1 for group in feature_groups):
+            file_string_replace(fused_template, runfile_dir+'fused-'+sparam+'.py', [('#SSHORT',sparam)])
+            created_file_counter += 1
+
+    end_section()
+    return (jobs, created_file_counter, created_directory_counter)
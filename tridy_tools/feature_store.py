@@ -0,0 +1,106 @@
+# Per-neuron feature store, shared by all selection parameters
+
+# The feature of a neuron depends only on its closed neighbourhood, the feature parameter and gap, and the connectivity matrix,
+# not on the partition whose bin selected it. The store keeps one row per neuron (index in the parameter dataframe), in a folder
+# per key <feature parameter>-<gap>-<matrix hash>, as neurons.npy and values.npy
+# The store is filled from feature vectors in results/ of any partition, and bins of a new partition whose neurons are all in the
+# store get their feature vectors assembled from it, so that only classification is left for them
+# Rows of <sparam>-<i>_feature_vectors.npy are taken to be the neurons of bin i in increasing order, as selected from its binary
+# parameter. This is not checked against TriDy. Only bins with at most number_nbhds neurons (all of them selected) are stored or
+# assembled, and create_runfiles() does not use the store if no bin is that small
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+from tridy_tools.vector_archive import read_archive_index, load_vector
+
+harvested_name = 'harvested.json'
+
+# Returns the SHA-1 of a file, computed once per file size and modification time
+@lru_cache(maxsize=None)
+def cached_hash(path, size, mtime):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_hash(path):
+    stat = os.stat(path)
+    return cached_hash(str(path), stat.st_size, stat.st_mtime)
+
+# Returns the name of the store folder of a feature parameter (pipeline name), gap and matrix hash
+def store_key(fparam, fgap, matrix_hash):
+    return fparam+'-'+(fgap if fgap != '' else 'none')+'-'+matrix_hash[:16]
+
+# Returns (neurons, values) of a store folder, sorted by neuron, or (None, None) if it is empty
+def read_store(store_dir, key):
+    location = Path(store_dir, key)
+    if not (location/'neurons.npy').is_file():
+        return None, None
+    return np.load(location/'neurons.npy'), np.load(location/'values.npy')
+
+# Saves (neurons, values) of a store folder, through temporary files so that readers never see a partial store
+def write_store(store_dir, key, neurons, values):
+    location = Path(store_dir, key)
+    location.mkdir(parents=True, exist_ok=True)
+    for name,array in [('values', values), ('neurons', neurons)]:
+        temporary = location/(name+'.'+str(os.getpid())+'.npy')
+        np.save(temporary, array)
+        os.replace(temporary, location/(name+'.npy'))
+
+# Adds the feature vectors of the given bins of results folders to a store folder
+# bins is a list of (results folder, sparam, partition, list of bins). Bins already added are skipped
+# Returns the number of neurons added
+def harvest(store_dir, key, bins, number_nbhds):
+    location = Path(store_dir, key)
+    harvested = {}
+    if (location/harvested_name).is_file():
+        with open(location/harvested_name, 'r') as f:
+            harvested = json.load(f)
+    new_neurons = []
+    new_values = []
+    for folder,sparam,partition,current_bins in bins:
+        done = set(harvested.get(str(folder), []))
+        index = read_archive_index(folder)
+        for b in current_bins:
+            if b in done:
+                continue
+            neurons = np.sort(np.asarray(partition[b], dtype=int))
+            if 0 < len(neurons) <= number_nbhds:
+                vectors = load_vector(folder, sparam+'-'+str(b), index)
+                if len(vectors) == len(neurons):
+                    new_neurons.append(neurons)
+                    new_values.append(np.asarray(vectors))
+            harvested.setdefault(str(folder), []).append(b)
+    added = 0
+    if new_neurons != []:
+        neurons,values = read_store(store_dir, key)
+        if neurons is not None:
+            added = -len(neurons)
+            new_neurons.insert(0, neurons)
+            new_values.insert(0, values)
+        neurons = np.concatenate(new_neurons)
+        values = np.concatenate(new_values)
+        # Keep one row per neuron, the latest one
+        _,last = np.unique(neurons[::-1], return_index=True)
+        kept = len(neurons)-1-last
+        write_store(store_dir, key, neurons[kept], values[kept])
+        added += len(kept)
+    location.mkdir(parents=True, exist_ok=True)
+    with open(location/harvested_name, 'w') as f:
+        json.dump(harvested, f)
+    return added
+
+# Returns the feature vectors of a bin gathered from (neurons, values) of a store folder, or None if a neuron is missing
+def gather(neurons, values, members):
+    if neurons is None:
+        return None
+    members = np.sort(np.asarray(members, dtype=int))
+    position = np.searchsorted(neurons, members)
+    if len(members) == 0 or np.any(position >= len(neurons)) or np.any(neurons[np.minimum(position, len(neurons)-1)] != members):
+        return None
+    return values[position]
@@ -0,0 +1,81 @@
+# Columnar store of the parameters dataframe (parameters.pkl)
+
+# A store is a directory with one .npy file per column and an index file columns.json
+# Columns are read through a memory map, so only the requested columns are ever loaded
+# Every function accepting a store also accepts the path of a pickled dataframe, which is then loaded in full
+
+import json
+from pathlib import Path
+import numpy as np
+
+index_name = 'columns.json'
+
+# Returns True if source is a columnar store (a directory with an index file)
+def is_store(source):
+    return Path(source, index_name).is_file()
+
+# Returns the index of a store, a dictionary with the number of neurons and the file of every column
+def read_index(source):
+    with open(Path(source, index_name), 'r') as f:
+        return json.load(f)
+
+# Converts a pickled dataframe to a store in store_dir. Columns that are not numeric are skipped
+# Returns the number of created files
+def convert_dataframe(dataframe, store_dir, verbose=True):
+    import pandas as pd
+    df = pd.read_pickle(dataframe)
+    Path(store_dir).mkdir(parents=True, exist_ok=True)
+    index = {'nnum':len(df), 'columns':{}}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if not (np.issubdtype(values.dtype, np.number) or np.issubdtype(values.dtype, np.bool_)):
+            if verbose:
+                print('Column '+str(column)+' is not numeric, skipping', flush=True)
+            continue
+        index['columns'][str(column)] = str(column)+'.npy'
+        np.save(Path(store_dir, str(column)+'.npy'), np.ascontiguousarray(values))
+    with open(Path(store_dir, index_name), 'w') as f:
+        json.dump(index, f, indent=2)
+    return len(index['columns'])+1
+
+# Returns the list of column names of a store or dataframe
+def column_names(source):
+    if is_store(source):
+        return list(read_index(source)['columns'])
+    import pandas as pd
+    return [str(column) for column in pd.read_pickle(source).columns]
+
+# Returns the number of neurons (rows) of a store or dataframe
+def num_neurons(source):
+    if is_store(source):
+        return read_index(source)['nnum']
+    import pandas as pd
+    return len(pd.read_pickle(source))
+
+# Returns a memory map of one column of a store
+def column(source, name):
+    index = read_index(source)
+    assert name in index['columns'], 'Column \''+name+'\' not found in '+str(source)
+    return np.load(Path(source, index['columns'][name]), mmap_mode='r')
+
+# Returns the matrix (neurons x len(columns)) of the given columns, as a new array of type dtype
+# If out is given, the columns are written into it instead. If rows is given (a slice), only these neurons are returned
+def load_columns(source, columns, dtype=float, out=None, rows=slice(None)):
+    if is_store(source):
+        index = read_index(source)
+        for name in columns:
+            assert name in index['columns'], 'Input parameter \''+name+'\' not found in given dataframe column names'
+        if out is None:
+            out = np.empty((len(range(index['nnum'])[rows]), len(columns)), dtype=dtype)
+        for i,name in enumerate(columns):
+            out[:,i] = column(source, name)[rows]
+        return out
+    import pandas as pd
+    df = pd.read_pickle(source)
+    for name in columns:
+        assert name in df.columns, 'Input parameter \''+name+'\' not found in given dataframe column names'
+    values = df[columns].iloc[rows].to_numpy(dtype=dtype, copy=True)
+    if out is None:
+        return values
+    out[:] = values
+    return out
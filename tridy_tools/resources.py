@@ -0,0 +1,87 @@
+# Memory and time requests of jobs, from the costs of their bins and the resources used by earlier jobs
+
+# Earlier jobs are read from out-err/: the local-*.json summaries of run-local.py, and .err files of jobs run with '/usr/bin/time -v'
+# Time of a job is estimated as its cost (see scheduling.py) times the median seconds per cost of earlier jobs of the same feature
+# Memory of a job is estimated as a fixed part, the smallest peak memory of earlier jobs of the same feature, plus its cost times the largest memory per cost above that
+# Both are multiplied by a safety factor, and kept between given bounds. Without earlier jobs, the upper bounds are used
+
+import json
+import math
+from pathlib import Path
+import numpy as np
+
+# Returns the seconds of a GNU time elapsed string [h:]mm:ss[.ss]
+def elapsed_seconds(value):
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = 60*seconds+float(part)
+    return seconds
+
+# Returns (seconds, peak memory in MB) from an .err file of a job run with '/usr/bin/time -v', or None
+def read_time_output(err_file):
+    seconds = None
+    memory = None
+    with open(err_file, 'r', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('Elapsed (wall clock) time'):
+                seconds = elapsed_seconds(line.split(': ')[-1])
+            elif line.startswith('Maximum resident set size (kbytes)'):
+                memory = int(line.split(': ')[-1])/1024
+    if seconds is None or memory is None:
+        return None
+    return (seconds, memory)
+
+# Returns the bins of job job_num of collection name, from its configuration in config_dir, or None if not found
+# Tasks of job arrays write .err files named as jobs, and their bins are read from manifest.json, if it is newer than the job configuration
+def job_bins(config_dir, name, job_num, manifests):
+    config_file = Path(config_dir, name, job_num+'.json')
+    manifest_file = Path(config_dir, name, 'manifest.json')
+    if manifest_file.is_file() and (not config_file.is_file() or manifest_file.stat().st_mtime >= config_file.stat().st_mtime):
+        if name not in manifests:
+            with open(manifest_file, 'r') as f:
+                manifests[name] = json.load(f)['tasks']
+        return manifests[name].get(job_num)
+    if config_file.is_file():
+        with open(config_file, 'r') as f:
+            return json.load(f)['values']['selection_parameters']
+    return None
+
+# Returns earlier jobs as dictionaries with name, job number, seconds, peak memory in MB and bins ('<sparam>-<i>' names)
+# Bins of jobs found in .err files are read from their configuration (or job array manifest) in config_dir
+def read_history(outerr_dir, config_dir):
+    history = {}
+    manifests = {}
+    for summary in sorted(Path(outerr_dir).glob('local-*.json')):
+        with open(summary, 'r') as f:
+            for record in json.load(f)['jobs']:
+                if record['returncode'] == 0:
+                    history[(record['name'], record['job'])] = record
+    for err_file in Path(outerr_dir).glob('*.err'):
+        name,_,job_num = err_file.stem.rpartition('-')
+        if not job_num.isdigit() or (name, int(job_num)) in history:
+            continue
+        bins = job_bins(config_dir, name, job_num, manifests)
+        used = read_time_output(err_file) if bins is not None else None
+        if used is not None:
+            history[(name, int(job_num))] = {'name':name, 'job':int(job_num), 'seconds':used[0], 'max_rss_mb':used[1], 'bins':bins}
+    return list(history.values())
+
+# Returns (memory in GB, time in seconds) to request for each job, from the costs of the jobs
+# history is a list of (cost, seconds, peak memory in MB) of earlier jobs of the same feature
+def job_requests(job_costs, history, safety_factor, min_mem_gb, max_mem_gb, min_time_hours, max_time_hours):
+    if history == []:
+        return [(max_mem_gb, max_time_hours*3600) for cost in job_costs]
+    rate = float(np.median([seconds/max(cost, np.finfo(float).tiny) for cost,seconds,memory in history]))
+    base = min(memory for cost,seconds,memory in history)
+    mem_rate = max((memory-base)/max(cost, np.finfo(float).tiny) for cost,seconds,memory in history)
+    return [(min(max(safety_factor*(base+mem_rate*cost)/1024, min_mem_gb), max_mem_gb), min(max(safety_factor*rate*cost, min_time_hours*3600), max_time_hours*3600)) for cost in job_costs]
+
+# Returns a memory request for an .sbatch file, in whole GB
+def format_mem(mem_gb):
+    return str(int(math.ceil(mem_gb)))+'G'
+
+# Returns a time request for an .sbatch file, as hours:minutes:seconds
+def format_time(seconds):
+    seconds = int(math.ceil(seconds))
+    return '{0}:{1:02d}:{2:02d}'.format(seconds//3600, (seconds%3600)//60, seconds%60)
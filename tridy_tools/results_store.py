@@ -0,0 +1,113 @@
+# Consolidated store of classification results, partitioned by selection and feature parameter
+
+# A store is a directory with one folder per partition <sparam>/<fshort>/, holding one .npy file per column,
+# and an index file partitions.json with the number of rows and the smallest and largest value of every column of every partition
+# Partitions are added or replaced one at a time, without rewriting the others
+# Queries skip partitions whose keys or column ranges cannot match the predicates, and read columns through a memory map,
+# first the columns of the predicates and then the requested columns of the matching rows only
+
+import json
+import os
+import shutil
+import operator
+from pathlib import Path
+import numpy as np
+
+index_name = 'partitions.json'
+
+# Types of the columns of the dataframes of collect-results.py
+column_types = {'bin_number':'int32', 'cv_acc':'float64', 'cv_err':'float64', 'test_acc':'float64', 'test_err':'float64',
+    'nonzero_count':'int32', 'total_count':'int32', 'seconds':'float64'}
+
+operators = {'<':operator.lt, '<=':operator.le, '>':operator.gt, '>=':operator.ge, '==':operator.eq, '!=':operator.ne}
+
+# Returns the index of a store, a dictionary from partition name '<sparam>/<fshort>' to its keys, number of rows and column ranges
+def read_index(store_dir):
+    location = Path(store_dir, index_name)
+    if not location.is_file():
+        return {}
+    with open(location, 'r') as f:
+        return json.load(f)
+
+def write_index(store_dir, index):
+    temporary = Path(store_dir, index_name+'.'+str(os.getpid()))
+    with open(temporary, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(temporary, Path(store_dir, index_name))
+
+# Adds or replaces the partition of sparam and fshort with the columns of a dataframe (or dictionary of arrays)
+# Columns are converted to their type in column_types, other columns keep their own type
+# Returns the number of created files
+def write_partition(store_dir, sparam, fshort, df):
+    name = sparam+'/'+fshort
+    location = Path(store_dir, sparam, fshort)
+    temporary = Path(store_dir, sparam, '.'+fshort+'.'+str(os.getpid()))
+    temporary.mkdir(parents=True, exist_ok=True)
+    entry = {'sparam':sparam, 'fshort':fshort, 'rows':0, 'columns':{}}
+    for column in df:
+        values = np.asarray(df[column]).astype(column_types.get(column, np.asarray(df[column]).dtype))
+        np.save(temporary/(column+'.npy'), values)
+        entry['rows'] = len(values)
+        finite = values[~np.isnan(values)] if np.issubdtype(values.dtype, np.floating) else values
+        entry['columns'][column] = [finite.min().item(), finite.max().item()] if len(finite) > 0 else [None, None]
+    # The new partition replaces the old one before the index is updated
+    old = Path(store_dir, sparam, '.'+fshort+'.old.'+str(os.getpid()))
+    if location.is_dir():
+        os.replace(location, old)
+    os.replace(temporary, location)
+    if old.is_dir():
+        shutil.rmtree(old)
+    index = read_index(store_dir)
+    index[name] = entry
+    write_index(store_dir, index)
+    return len(entry['columns'])+1
+
+# Returns True if a partition can have rows matching all predicates (column, operator, value), from its column ranges
+def may_match(entry, where):
+    for column,op,value in where:
+        if column in ['sparam', 'fshort']:
+            if not (entry[column] in value if op == 'in' else operators[op](entry[column], value)):
+                return False
+            continue
+        low,high = entry['columns'].get(column, [None, None])
+        if low is None:
+            return False
+        if op == 'in':
+            if not any(low <= v <= high for v in value):
+                return False
+        elif (op in ['<', '<='] and not operators[op](low, value)) or (op in ['>', '>='] and not operators[op](high, value)) or (op == '==' and not low <= value <= high):
+            return False
+    return True
+
+# Returns the rows of all partitions matching the predicates, as a dictionary of arrays with the columns and sparam and fshort
+# where is a list of (column, operator, value), with operator one of <, <=, >, >=, ==, !=, in. Columns sparam and fshort select partitions
+# columns is the list of columns to return, all columns if None. partitions is an optional function of an index entry selecting partitions
+def query(store_dir, where=(), columns=None, partitions=None):
+    index = read_index(store_dir)
+    selected = [entry for entry in index.values() if (partitions is None or partitions(entry)) and may_match(entry, where)]
+    if columns is None:
+        columns = sorted(set(column for entry in selected for column in entry['columns']))
+    result = {column:[] for column in ['sparam', 'fshort']+list(columns)}
+    for entry in selected:
+        location = Path(store_dir, entry['sparam'], entry['fshort'])
+        mask = np.ones(entry['rows'], dtype=bool)
+        for column,op,value in where:
+            if column not in ['sparam', 'fshort']:
+                values = np.load(location/(column+'.npy'), mmap_mode='r')
+                mask &= np.isin(values, list(value)) if op == 'in' else operators[op](values, value)
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            continue
+        result['sparam'].append(np.full(len(rows), entry['sparam'], dtype=object))
+        result['fshort'].append(np.full(len(rows), entry['fshort'], dtype=object))
+        for column in columns:
+            if column in entry['columns']:
+                result[column].append(np.load(location/(column+'.npy'), mmap_mode='r')[rows])
+            else:
+                result[column].append(np.full(len(rows), np.nan))
+    return {column:(np.concatenate(values) if values != [] else np.array([])) for column,values in result.items()}
+
+# Returns the result of query as a pandas dataframe
+def query_dataframe(store_dir, where=(), columns=None, partitions=None):
+    import pandas as pd
+    return pd.DataFrame(query(store_dir, where, columns, partitions))
@@ -0,0 +1,68 @@
+# Cost estimates of bins and assignment of bins to jobs
+
+# The cost of a bin is the sum of the costs of its neurons, or a measured runtime if one is known
+# Bins are assigned to jobs by longest processing time first, which keeps the slowest job close to the average
+
+import heapq
+import json
+from pathlib import Path
+import numpy as np
+
+# Returns the neurons of the given bins one after the other, the offset of every bin in this order, and the sizes of the bins
+def bin_layout(bins):
+    sizes = np.array([len(b) for b in bins], dtype=np.int64)
+    order = np.concatenate([np.asarray(b,dtype=np.int64) for b in bins]+[np.zeros(0,dtype=np.int64)])
+    return (order, np.cumsum(sizes)-sizes, sizes)
+
+# Returns ufunc (np.add, np.minimum or np.maximum) reduced over the rows of every bin of ordered_values, laid out as by bin_layout
+# Only non-empty bins are passed to reduceat, whose segments end at the next offset, empty bins get fill
+def reduce_bins(ufunc, ordered_values, offsets, sizes, fill):
+    reduced = np.full((len(sizes),)+ordered_values.shape[1:], fill, dtype=float)
+    if np.any(sizes > 0):
+        reduced[sizes > 0] = ufunc.reduceat(ordered_values, offsets[sizes > 0], axis=0)
+    return reduced
+
+# Returns the cost of every bin of a partition, the sum of neuron_costs over the neurons of the bin
+def bin_costs(partition, neuron_costs):
+    order,offsets,sizes = bin_layout(partition)
+    return reduce_bins(np.add, np.asarray(neuron_costs,dtype=float)[order], offsets, sizes, 0)
+
+# Reads measured runtimes (in seconds) of earlier runs, a JSON dictionary from bin names '<sparam>-<i>' to seconds
+# Returns an array of length num_bins for the given sparam, with NaN where no runtime is known
+def read_runtimes(runtime_file, sparam, num_bins):
+    runtimes = np.full(num_bins, np.nan)
+    if runtime_file is None or not Path(runtime_file).is_file():
+        return runtimes
+    with open(runtime_file, 'r') as f:
+        measured = json.load(f)
+    for name,seconds in measured.items():
+        current_sparam,_,current_bin = name.rpartition('-')
+        if current_sparam == sparam and current_bin.isdigit() and int(current_bin) < num_bins:
+            runtimes[int(current_bin)] = seconds
+    return runtimes
+
+# Replaces estimated costs by measured runtimes where known
+# Estimates of the other bins are scaled to seconds by the median ratio of runtime to estimate
+def merge_runtimes(costs, runtimes):
+    measured = ~np.isnan(runtimes)
+    if not measured.any():
+        return costs
+    ratios = runtimes[measured]/np.maximum(costs[measured], np.finfo(float).tiny)
+    merged = costs*np.median(ratios)
+    merged[measured] = runtimes[measured]
+    return merged
+
+# Assigns bins to num_jobs jobs, longest processing time first: each bin goes to the currently cheapest job
+# Returns a list of lists of bins (one per job, empty jobs removed) and the total cost of each job
+def lpt_schedule(bins, costs, num_jobs):
+    order = np.argsort(-np.asarray(costs), kind='stable')
+    heap = [(0.0, job_num) for job_num in range(num_jobs)]
+    job_list = [[] for job_num in range(num_jobs)]
+    job_costs = [0.0]*num_jobs
+    for i in order:
+        current_cost,job_num = heapq.heappop(heap)
+        job_list[job_num].append(bins[i])
+        job_costs[job_num] = current_cost+costs[i]
+        heapq.heappush(heap, (job_costs[job_num], job_num))
+    kept = [job_num for job_num in range(num_jobs) if job_list[job_num] != []]
+    return [sorted(job_list[job_num]) for job_num in kept], [job_costs[job_num] for job_num in kept]
@@ -0,0 +1,180 @@
+# Timing and memory of the sections of a script, written as JSON lines
+
+# A span records wall time, CPU time, peak memory (and its increase), and bytes (by write calls, including output) and files written between its start and end
+# Scripts call section() at each of their '## Section' headers, which ends the previous section, and can nest further spans with span()
+# A run starts when configure() is called with the span file (from the configuration file), and ends at the next configure() or at exit, with a 'total' span
+# The first run of a process starts with a section of loading packages, from the start of the process. Importing this module starts nothing
+# Spans started before configure() are kept, and written once it is called
+# With profile, the rest of the run also runs under cProfile, dumped by finish() as <stage>-<time>.prof next to the span file
+# read_spans() reads span files, and the 'SPAN {...}' lines that the modified pipeline.py writes to the .err files of jobs
+
+import json
+import os
+import sys
+import time
+import atexit
+import resource
+from pathlib import Path
+
+span_marker = 'SPAN '
+
+state = {'script':Path(sys.argv[0]).stem, 'stage':Path(sys.argv[0]).stem, 'file':None, 'pending':[], 'open':[], 'section':None, 'profiler':None, 'profile_file':None, 'files':None, 'finished':True, 'start':None, 'pid':None}
+
+# Returns the number of bytes written by this process, or None if not known (only available on Linux)
+def bytes_written():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+# Returns the time at which this process started, or now if not known (only available on Linux)
+def process_start():
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time()-uptime+start_ticks/os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+# Returns the peak memory of this process in MB
+# This is its own high-water mark (VmHWM, only available on Linux), since ru_maxrss includes the memory of the process it was forked from
+def peak_memory():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+def snapshot():
+    return {'time':time.time(), 'cpu':time.process_time(), 'max_rss_mb':peak_memory(), 'bytes':bytes_written(),
+        'files':state['files']() if state['files'] is not None else None}
+
+def write(record):
+    if state['file'] is None:
+        state['pending'].append(record)
+    else:
+        with open(state['file'], 'a') as f:
+            f.write(json.dumps(record)+'\n')
+
+# Starts a run: ends the previous run of this process, if any, sets the span file, starts the profiler if profile is True, and writes the spans that ended so far
+# files is an optional function returning the number of files created so far (the created_file_counter of the script)
+# stage names the spans that follow, by default the name of the script
+def configure(span_file, profile=False, files=None, stage=None):
+    if state['pid'] == os.getpid():
+        finish()
+    elif state['pid'] is None:
+        atexit.register(finish)
+    first = state['pid'] is None
+    state['pid'] = os.getpid()
+    state['finished'] = False
+    state['section'] = None
+    state['stage'] = stage if stage is not None else state['script']
+    state['file'] = span_file
+    state['files'] = files
+    if span_file is not None:
+        Path(span_file).parent.mkdir(parents=True, exist_ok=True)
+        for record in state['pending']:
+            write(record)
+    state['pending'] = []
+    if profile and state['profiler'] is None:
+        import cProfile
+        state['profiler'] = cProfile.Profile()
+        state['profile_file'] = Path(span_file).with_name(state['stage']+'-'+time.strftime('%Y%m%d-%H%M%S')+'.prof')
+        state['profiler'].enable()
+
+    # Loading packages is the first section of the first run, from the start of the process. Later runs start now
+    if first:
+        state['start'] = {'time':process_start(), 'cpu':0, 'cpu_children':0, 'bytes':0}
+        state['section'] = start_span('load packages')
+        state['section']['start'].update({'time':state['start']['time'], 'cpu':0, 'max_rss_mb':0, 'bytes':0})
+    else:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        state['start'] = {'time':time.time(), 'cpu':time.process_time(), 'cpu_children':children.ru_utime+children.ru_stime, 'bytes':bytes_written()}
+
+# Starts a span, returns a handle for end_span()
+def start_span(name, **attributes):
+    handle = {'name':name, 'parent':state['open'][-1]['name'] if state['open'] != [] else None, 'attributes':attributes, 'start':snapshot()}
+    state['open'].append(handle)
+    return handle
+
+# Ends a span and writes it, with further attributes if given
+def end_span(handle, **attributes):
+    end = snapshot()
+    start = handle['start']
+    if handle in state['open']:
+        state['open'].remove(handle)
+    record = {'stage':state['stage'], 'span':handle['name'], 'parent':handle['parent'], 'start':start['time'],
+        'wall':end['time']-start['time'], 'cpu':end['cpu']-start['cpu'], 'max_rss_mb':end['max_rss_mb'], 'rss_increase_mb':end['max_rss_mb']-start['max_rss_mb'],
+        'bytes_written':None if start['bytes'] is None or end['bytes'] is None else end['bytes']-start['bytes'],
+        'files_written':None if start['files'] is None or end['files'] is None else end['files']-start['files']}
+    record.update(handle['attributes'])
+    record.update(attributes)
+    write(record)
+
+# Context manager of a span
+class span:
+    def __init__(self, name, **attributes):
+        self.name = name
+        self.attributes = attributes
+    def __enter__(self):
+        self.handle = start_span(self.name, **self.attributes)
+        return self
+    def __exit__(self, *exception):
+        end_span(self.handle)
+        return False
+
+# Ends the current section, if any, and starts the next one
+def section(name, **attributes):
+    end_section()
+    state['section'] = start_span(name, **attributes)
+
+# Ends the current section, if any
+def end_section():
+    if state['section'] is not None:
+        end_span(state['section'])
+        state['section'] = None
+
+# Ends the current section, writes a span of the whole run, and dumps the profile. Called at exit if not called before
+def finish():
+    if state['finished'] or state['pid'] != os.getpid():
+        return
+    state['finished'] = True
+    end_section()
+    if state['profiler'] is not None:
+        state['profiler'].disable()
+        state['profiler'].dump_stats(state['profile_file'])
+        state['profiler'] = None
+    if state['file'] is not None:
+        start = state['start']
+        end_bytes = bytes_written()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        write({'stage':state['stage'], 'span':'total', 'parent':None, 'start':start['time'], 'wall':time.time()-start['time'], 'cpu':time.process_time()-start['cpu'],
+            'cpu_children':children.ru_utime+children.ru_stime-start['cpu_children'], 'max_rss_mb':peak_memory(), 'max_rss_children_mb':children.ru_maxrss/1024,
+            'bytes_written':None if start['bytes'] is None or end_bytes is None else end_bytes-start['bytes'], 'files_written':state['files']() if state['files'] is not None else None})
+
+# Returns all spans of span files and of 'SPAN {...}' lines in job output, as a list of dictionaries
+def read_spans(files):
+    spans = []
+    for file in files:
+        with open(file, 'r', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith(span_marker):
+                    line = line[len(span_marker):]
+                elif not str(file).endswith('.jsonl'):
+                    continue
+                if line.startswith('{'):
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        pass
+    return spans
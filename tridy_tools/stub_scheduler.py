@@ -0,0 +1,76 @@
+# Local stand-in for sbatch and sacct, for testing supervise-jobs.py without a cluster
+
+# Usage, from the TriDy-tools directory:
+#   python -m tridy_tools.stub_scheduler submit <file.sbatch>     prints a job ID, runs the file with bash in the background
+#   python -m tridy_tools.stub_scheduler status <id> [<id> ...]   prints '<id>|<state>' for every known job
+# Output and errors go to the files given by '#SBATCH -o' and '#SBATCH -e', the time limit of '#SBATCH --time' is applied
+# Job states are kept in the directory given by the environment variable STUB_SCHEDULER_DIR (default ./out-err/stub/)
+
+import os
+import sys
+import json
+import time
+import subprocess
+from pathlib import Path
+
+state_dir = Path(os.environ.get('STUB_SCHEDULER_DIR', './out-err/stub/'))
+
+# Returns the value of an #SBATCH option of an .sbatch file, or None
+def sbatch_option(lines, names):
+    for line in lines:
+        parts = line.split('#')[1].split() if line.startswith('#SBATCH') else []
+        for i,part in enumerate(parts[1:]):
+            for name in names:
+                if part == name and i+2 < len(parts):
+                    return parts[i+2]
+                if part.startswith(name+'='):
+                    return part[len(name)+1:]
+    return None
+
+# Returns the number of seconds of a Slurm time limit [days-]hours:minutes:seconds, or None
+def time_limit(value):
+    if value is None:
+        return None
+    days,_,rest = value.rpartition('-')
+    parts = [int(p) for p in rest.split(':')]
+    while len(parts) < 3:
+        parts = [0]+parts
+    return int(days or 0)*86400+parts[0]*3600+parts[1]*60+parts[2]
+
+def submit(sbatch_file):
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with open(sbatch_file, 'r') as f:
+        lines = f.readlines()
+    out = sbatch_option(lines, ['-o', '--output']) or os.devnull
+    err = sbatch_option(lines, ['-e', '--error']) or os.devnull
+    limit = time_limit(sbatch_option(lines, ['-t', '--time']))
+    job_id = str(int(time.time()*1000) % 10**9)+str(os.getpid() % 1000).zfill(3)
+    exit_file = state_dir/(job_id+'.exit')
+    command = 'bash '+str(Path(sbatch_file).resolve())
+    if limit is not None:
+        command = 'timeout '+str(limit)+' '+command
+    # Exit code 124 of timeout is recorded as a time limit
+    wrapper = command+' >'+out+' 2>'+err+'; echo $? > '+str(exit_file)
+    process = subprocess.Popen(['bash', '-c', wrapper], start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(state_dir/(job_id+'.json'), 'w') as f:
+        json.dump({'pid':process.pid}, f)
+    print(job_id, flush=True)
+
+def status(job_ids):
+    for job_id in job_ids:
+        job_file = state_dir/(job_id+'.json')
+        exit_file = state_dir/(job_id+'.exit')
+        if not job_file.is_file():
+            continue
+        if exit_file.is_file():
+            code = int(exit_file.read_text().strip() or 1)
+            state = 'COMPLETED' if code == 0 else ('TIMEOUT' if code == 124 else ('OUT_OF_MEMORY' if code == 137 else 'FAILED'))
+        else:
+            state = 'RUNNING'
+        print(job_id+'|'+state, flush=True)
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'submit':
+        submit(sys.argv[2])
+    elif sys.argv[1] == 'status':
+        status(sys.argv[2:])
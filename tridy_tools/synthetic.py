@@ -0,0 +1,72 @@
+# Synthetic inputs of all steps, for benchmarks without real data or a cluster
+
+# Parameters are random, with tribe sizes and degrees drawn as integers and all other columns as floats, in the shape of parameters.pkl
+# Partitions split the neurons in random order into bins of equal size
+# Result files follow the text format of TriDy (a line with the bin name, then a line starting with 'CV'), optionally with records
+
+import json
+from pathlib import Path
+import numpy as np
+
+integer_columns = ['tribe_size', 'deg', 'in_deg', 'out_deg', 'rc', 'rc_chief', '0simplices', '1simplices', '2simplices', '3simplices']
+
+# Returns a dataframe of nnum neurons with the given columns, and num_extra further columns named extra_<k>
+def synthetic_parameters(nnum, columns, num_extra=0, seed=0):
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    data = {}
+    for column in columns:
+        if column in integer_columns:
+            data[column] = rng.lognormal(4, 1, nnum).astype(np.int64)+1
+        else:
+            data[column] = rng.random(nnum)
+    for k in range(num_extra):
+        data['extra_'+str(k)] = rng.random(nnum)
+    return pd.DataFrame(data)
+
+# Returns a partition of nnum neurons into bins of binsize neurons (the last one possibly smaller), as a 1D object array
+def synthetic_partition(nnum, binsize, seed=0):
+    order = np.random.default_rng(seed).permutation(nnum)
+    partition = np.empty(-(-nnum//binsize), dtype=object)
+    for i in range(len(partition)):
+        partition[i] = np.sort(order[i*binsize:(i+1)*binsize])
+    return partition
+
+# Writes result files of num_bins bins of sparam, split into num_jobs files, into folder
+# If records is True, the .jsonl result records of the modified pipeline.py are written as well
+# Returns the number of created files
+def synthetic_results(folder, sparam, fparam, num_bins, num_jobs, records=False, seed=0):
+    rng = np.random.default_rng(seed)
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    created_file_counter = 0
+    for job_num,bins in enumerate(np.array_split(np.arange(num_bins), num_jobs)):
+        lines = []
+        job_records = []
+        for b in bins:
+            cv_acc,test_acc = rng.random(2)
+            cv_err,test_err = rng.random(2)/10
+            nonzero = int(rng.integers(1, 31))
+            lines.append(sparam+'-'+str(b)+'\n')
+            lines.append('CV accuracy: {0:.4f} +- {1:.4f}, test accuracy: {2:.4f} +- {3:.4f}, nonzero {4} of {5}\n'.format(cv_acc, cv_err, test_acc, test_err, nonzero, 30))
+            job_records.append({'bin':sparam+'-'+str(b), 'bin_number':int(b), 'cv_acc':round(cv_acc, 4), 'cv_err':round(cv_err, 4), 'test_acc':round(test_acc, 4),
+                'test_err':round(test_err, 4), 'nonzero_count':nonzero, 'total_count':30, 'seconds':float(rng.random())})
+        with open(Path(folder, 'classification_accuracies_'+fparam+'_'+str(job_num)+'.txt'), 'w') as f:
+            f.writelines(lines)
+        created_file_counter += 1
+        if records:
+            with open(Path(folder, 'classification_records_'+fparam+'_'+str(job_num)+'.jsonl'), 'w') as f:
+                f.writelines(json.dumps(record)+'\n' for record in job_records)
+            created_file_counter += 1
+    return created_file_counter
+
+# Writes stand-ins of TriDy's toolbox.py and pipeline.py to tridy_dir, with the lines modified by create-runfiles.py
+def synthetic_tridy(tridy_dir):
+    Path(tridy_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(tridy_dir, 'toolbox.py'), 'w') as f:
+        f.write('import numpy as np\nparam_dict = {}\nparam_dict_inverse = {v:k for k,v in param_dict.items()}\n'
+            'param_files = [np.load(dir_export+\'individual_parameters/\'+param_dict_inverse[f]+\'.npy\',allow_pickle=True) for f in param_names]\n')
+    with open(Path(tridy_dir, 'pipeline.py'), 'w') as f:
+        f.write('import json, sys\nexec(open(\'toolbox.py\').read())\nconfig_dict = json.load(open(sys.argv[1]))\n'
+            'bin_number = config_dict[\'values\'][\'bin_number\']\nsavefolder = config_dict[\'paths\'][\'savefolder\']\n'
+            'feature_parameter = config_dict[\'values\'][\'feature_parameter\']\n'
+            'output = open(savefolder + \'classification_accuracies_\'+feature_parameter+\'.txt\',\'w\')\nclassify()\n')
@@ -0,0 +1,86 @@
+# Archive of the per-bin feature vectors of a results folder
+
+# The feature vectors of all bins of a results folder are kept in one data file, feature_vectors.bin, with an index
+# feature_vectors.json from bin name '<sparam>-<i>' to offset, dtype and shape of its array in the data file
+# Vectors are appended to the data file in chunks (one per compaction), each array aligned to 64 bytes, so that a single bin
+# is read through a memory map without reading the rest, and all bins with one sequential read
+# Bins that are not archived are read from their <sparam>-<i>_feature_vectors.npy file
+
+import json
+import os
+from pathlib import Path
+import numpy as np
+from tridy_tools.completion import feature_suffix
+
+data_name = 'feature_vectors.bin'
+archive_index_name = 'feature_vectors.json'
+alignment = 64
+
+# Returns the index of the archive of a results folder, from bin name to [offset, dtype, shape]
+def read_archive_index(folder):
+    location = Path(folder, archive_index_name)
+    if not location.is_file():
+        return {}
+    with open(location, 'r') as f:
+        return json.load(f)['vectors']
+
+# Returns the set of bins of sparam in the archive of a results folder
+def archived_bins(folder, sparam):
+    bins = set()
+    for name in read_archive_index(folder):
+        current_sparam,_,current_bin = name.rpartition('-')
+        if current_sparam == sparam:
+            bins.add(int(current_bin))
+    return bins
+
+# Appends the given loose feature vector files of a results folder to its archive, as one chunk
+# Files holding Python objects cannot be memory mapped and are left as they are
+# Returns the list of bin names that were added
+def append_vectors(folder, names):
+    index = read_archive_index(folder)
+    data_file = Path(folder, data_name)
+    added = []
+    with open(data_file, 'ab') as f:
+        for name in names:
+            if name in index:
+                continue
+            vectors = np.load(Path(folder, name+feature_suffix), allow_pickle=True)
+            if vectors.dtype.hasobject:
+                continue
+            f.write(b'\0'*(-f.tell() % alignment))
+            index[name] = [f.tell(), vectors.dtype.str, list(vectors.shape)]
+            f.write(np.ascontiguousarray(vectors).tobytes())
+            added.append(name)
+        f.flush()
+        os.fsync(f.fileno())
+    # The index is replaced only after the data is written, so readers never see offsets past the end of the data
+    if added != []:
+        temporary = Path(folder, archive_index_name+'.'+str(os.getpid()))
+        with open(temporary, 'w') as f:
+            json.dump({'data':data_name, 'vectors':index}, f)
+        os.replace(temporary, Path(folder, archive_index_name))
+    return added
+
+# Returns the feature vectors of bin name ('<sparam>-<i>') of a results folder, from the archive or the loose file
+# index can be given to avoid reading the index again
+def load_vector(folder, name, index=None):
+    if index is None:
+        index = read_archive_index(folder)
+    if name in index:
+        offset,dtype,shape = index[name]
+        if np.prod(shape) == 0:
+            return np.empty(shape, dtype=np.dtype(dtype))
+        return np.array(np.memmap(Path(folder, data_name), dtype=np.dtype(dtype), mode='r', offset=offset, shape=tuple(shape)))
+    return np.load(Path(folder, name+feature_suffix), allow_pickle=True)
+
+# Returns a dictionary from bin name to feature vectors of all bins in the archive of a results folder, read at once
+def load_archive(folder):
+    index = read_archive_index(folder)
+    if index == {}:
+        return {}
+    data = np.fromfile(Path(folder, data_name), dtype=np.uint8)
+    vectors = {}
+    for name,(offset,dtype,shape) in index.items():
+        dtype = np.dtype(dtype)
+        vectors[name] = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    return vectors